@@ -1,4 +1,4 @@
 requires = [
     "appdirs",
-    "pillow",
+    "pillow>=8",
 ]
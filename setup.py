@@ -77,6 +77,11 @@ def setuptools_setup():
         license="gplv3.txt",
         packages=find_packages(),
         scripts=scripts,
+        entry_points={
+            "console_scripts": [
+                "text_img_creator = text_img_creator.cli:main",
+            ],
+        },
         install_requires=requires,
         setup_requires=requires,
     )
@@ -1,12 +1,19 @@
 #!/usr/bin/python3
 """Provide functions for creation of images and animations featuring text."""
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageOps
+import os
 from os import environ
+from io import BytesIO
 import subprocess
 from math import floor, log, ceil
 from functools import wraps
-from text_img_creator.img_utils import ImageProps
+from text_img_creator.img_utils import ImageProps, ImageText
+from text_img_creator.font_cache import get_font
+from text_img_creator.prop_store import get_property_store
+from text_img_creator.svg_trace import tracers
+from text_img_creator.svg_compose import compose_svgs, stack_svgs
+from text_img_creator import encoders, instrument, svg_glyphs
 
 
 fname_key = ImageProps.fname_key
@@ -14,11 +21,26 @@ ext_key = ImageProps.ext_key
 width_key = ImageProps.width_key
 height_key = ImageProps.height_key
 back_col_key = ImageProps.back_col_key
+img_key = ImageProps.img_key
 frame_fname_base = "frame_"
 default_color_mode = "RGBA"
 black_col = (0, 0, 0, 255)
 white_col = (255, 255, 255, 255)
 transparent_col = (0, 0, 0, 0)
+linear_calibration = "linear"
+log_calibration = "log"
+calibration_probe_size = 64
+shell_tracer = "shell"
+potrace_tracer = "potrace"
+python_tracer = "python"
+pairwise_stacking = "pairwise"
+single_stacking = "single"
+lines_svg = "lines"
+layers_svg = "layers"
+glyphs_svg = "glyphs"
+resize_final_size = "resize"
+direct_final_size = "direct"
+final_size_passes = 4
 
 
 def get_bash_var_name(*args):
@@ -37,36 +59,27 @@ def get_bash_var_name(*args):
 
 
 def record_image_properties(func):
-    """Write ImageProp (or dict) properties to file."""
+    """Write ImageProp (or dict) properties to file.
+
+    Values go through the PropertyStore of $img_properties, which buffers
+    and locks writes (see prop_store.set_flush_interval).
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
         properties = func(*args, **kwargs)
-        with open(environ["img_properties"]) as ip:
-            lines = ip.readlines()
         bash_vars = {}
         for p in properties:
             f = p[fname_key]
             e = p[ext_key]
             for k, v in p.items():
+                if k == img_key:
+                    continue
                 if k == ext_key:
                     bash_vars[get_bash_var_name(f, e, "")] = str(f) + str(v)
                 bash_vars[get_bash_var_name(f, e, k)] = str(v)
 
-        for i in range(len(lines)):
-            if lines[i].startswith("export"):
-                split_line = lines[i].split()
-                var, val = split_line[1].split("=")
-                if var in bash_vars:
-                    val = bash_vars[var]
-                    del bash_vars[var]
-                    bash_c = ["export", var + "=" + '"' + val + '"']
-                    lines[i] = " ".join(bash_c) + "\n"
-
-        for k, v in bash_vars.items():
-            lines.append(" ".join(["export", k + "=" + '"' + v + '"']) + "\n")
-
-        with open(environ["img_properties"], "w+") as ip:
-            ip.writelines(lines)
+        with instrument.stage("record_image_properties"):
+            get_property_store(environ["img_properties"]).update(bash_vars)
 
         return properties
 
@@ -86,87 +99,283 @@ def encode_hex_col(color):
     if isinstance(color, tuple):
         for c in color:
             hex_col += format(c, '02x')
-            return hex_col
+        return hex_col
     return color
 
 
+def ink_box_pixels(img, fill):
+    """Find box of fill colored pixels by scanning them one at a time."""
+    tw, th = img.size
+
+    # Find Fatty height
+    pixels = img.load()
+    top_till_text = 0
+    bottom_till_text = th
+    found_top = False
+    found_bottom = False
+    for y in range(th):
+        for x in range(tw):
+            if pixels[x, y] == fill and (not found_top):
+                top_till_text = y
+                found_top = True
+                if found_bottom:
+                    break
+
+            if pixels[x, (th - 1) - y] == fill and (not found_bottom):
+                bottom_till_text = (th - 1) - y
+                found_bottom = True
+                if found_top:
+                    break
+        else:
+            continue
+        break
+
+    # Find Fatty Width
+    widest_left_x = tw
+    widest_right_x = 0
+    found_left_x = False
+    found_right_x = False
+    for x in range(tw):
+        for y in range(th):
+            if pixels[x, y] == fill and (not found_left_x):
+                widest_left_x = x
+                found_left_x = True
+                if found_right_x:
+                    break
+            if pixels[(tw - 1) - x, y] == fill and (not found_right_x):
+                widest_right_x = (tw - 1) - x
+                found_right_x = True
+                if found_left_x:
+                    break
+        else:
+            continue
+        break
+
+    # No ink at all (sizes too small to fully cover a pixel)
+    if not found_top:
+        return 0, 0, 0, 0
+
+    width = widest_right_x - widest_left_x
+    height = bottom_till_text - top_till_text
+    start_x = -widest_left_x
+    start_y = -top_till_text
+
+    return width, height, start_x, start_y
+
+
+def ink_box_bbox(img, fill):
+    """Find box of fill colored pixels with Pillow's C getbbox.
+
+    Each band is thresholded to an exact match of its fill component and
+    the bands are combined with a pixelwise minimum, so only pixels equal
+    to fill count, as in ink_box_pixels.
+    """
+    tw, th = img.size
+    mask = None
+    for band, c in zip(img.split(), fill):
+        band = band.point([255 if v == c else 0 for v in range(256)])
+        mask = band if mask is None else ImageChops.darker(mask, band)
+
+    box = mask.getbbox() if tw and th else None
+    if box is None:
+        return 0, 0, 0, 0
+
+    left, top, right, bottom = box
+    return (right - 1) - left, (bottom - 1) - top, -left, -top
+
+
+def ink_box_metrics(font, text):
+    """Find box text's ink may cover from font metrics, without drawing it.
+
+    The box holds every partly covered pixel, so it contains the box of
+    fill colored pixels the other backends find and is up to a pixel or two
+    larger.
+    """
+    left, top, right, bottom = font.getbbox(text)
+    if right <= left or bottom <= top:
+        return 0, 0, 0, 0
+    return (right - 1) - left, (bottom - 1) - top, -left, -top
+
+
+pixels_measure = "pixels"
+bbox_measure = "bbox"
+metrics_measure = "metrics"
+ink_box_backends = {
+    pixels_measure: ink_box_pixels,
+    bbox_measure: ink_box_bbox,
+}
+
+
+def search_font_size(fits, guess, low=0, high=None):
+    """Find largest size in [low, high] for which fits(size) holds.
+
+    Steps away from guess in doubling strides until the boundary is
+    bracketed, then bisects. fits is assumed to be monotonic in size.
+    Returns low - 1 if no size fits.
+    """
+    if high is not None:
+        guess = min(guess, high)
+    guess = max(guess, low)
+
+    step = 1
+    if fits(guess):
+        lo, hi = guess, None
+        while hi is None:
+            if high is not None and lo >= high:
+                return lo
+            size = lo + step
+            if high is not None:
+                size = min(size, high)
+            if fits(size):
+                lo = size
+                step *= 2
+            else:
+                hi = size
+    else:
+        lo, hi = None, guess
+        while lo is None:
+            if hi <= low:
+                return low - 1
+            size = max(hi - step, low)
+            if fits(size):
+                lo = size
+            else:
+                hi = size
+                step *= 2
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+@instrument.timed("determine_min_image_size")
 def determine_min_image_size(
     text,
     text_seperation,
     font_name=None,
     font_size=None,
-    horizontal=False
+    horizontal=False,
+    calibration=linear_calibration,
+    measure=bbox_measure,
+    measure_index=None
 ):
-    """Determine minimum image size to contain text."""
+    """Determine minimum image size to contain text.
+
+    calibration selects how the font size is found when font_size is None:
+    linear_calibration renders and measures sizes upward one at a time and
+    stops at the first size missing the targets. log_calibration stops at
+    the same size, but skips rendering the sizes whose font metrics or
+    glyph coverage mask (which both contain the ink) already meet the
+    targets, so it only renders the few sizes right below it. The number
+    of sizes rendered for each text is stored on its probes attribute.
+
+    measure names the ink_box_backends entry used to find the text's ink
+    box in each rendered probe, or is metrics_measure to take it from the
+    font's metrics without rendering probes (see ink_box_metrics).
+
+    measure_index (a MeasureIndex) is consulted before measuring each text
+    and updated after, so repeated texts skip calibration.
+    """
+    if measure == metrics_measure:
+        ink_box = None
+    else:
+        ink_box = ink_box_backends[measure]
+
     def generate_fonts(font_name):
-        """Generate progressively larger fonts."""
-        i = 0
+        """Generate progressively larger fonts, from size 1."""
+        i = 1
         while True:
-            yield ImageFont.truetype(font_name, i)
+            yield get_font(font_name, i)
             i += 1
 
     def image_size_with_font(t, f):
-            tw, th = tmp_draw.textsize(t, font=f)
+            if ink_box is None:
+                return ink_box_metrics(f, t)
+            _, _, tw, th = f.getbbox(t)
             small_img = Image.new(default_color_mode, (tw, th), transparent_col)
             small_draw = ImageDraw.Draw(small_img)
             small_draw.text((0, 0), t, font=f, fill=text_fill_col)
 
-            # Find actual text width
-
-            # Find Fatty height
-            pixels = small_img.load()
-            top_till_text = 0
-            bottom_till_text = th
-            found_top = False
-            found_bottom = False
-            for y in range(th):
-                for x in range(tw):
-                    if pixels[x, y] == text_fill_col and (not found_top):
-                        top_till_text = y
-                        found_top = True
-                        if found_bottom:
-                            break
-
-                    if pixels[x, (th - 1) - y] == text_fill_col and (not found_bottom):
-                        bottom_till_text = (th - 1) - y
-                        found_bottom = True
-                        if found_top:
-                            break
-                else:
-                    continue
-                break
+            # Find actual text width and height
+            return ink_box(small_img, text_fill_col)
 
-            # Find Fatty Width
-            widest_left_x = tw
-            widest_right_x = 0
-            found_left_x = False
-            found_right_x = False
-            for x in range(tw):
-                for y in range(th):
-                    if pixels[x, y] == text_fill_col and (not found_left_x):
-                        widest_left_x = x
-                        found_left_x = True
-                        if found_right_x:
-                            break
-                    if pixels[(tw - 1) - x, y] == text_fill_col and (not found_right_x):
-                        widest_right_x = (tw - 1) - x
-                        found_right_x = True
-                        if found_left_x:
-                            break
-                else:
-                    continue
-                break
+    def padded_size_with_font(t, f, padding):
+        """Measure text with font, including padding."""
+        p_t, p_b, p_l, p_r = padding
+        w, h, sx, sy = image_size_with_font(t, f)
+        return w + p_l + p_r, h + p_t + p_b, sx + p_l, sy + p_t
 
-            width = widest_right_x - widest_left_x
-            height = bottom_till_text - top_till_text
-            start_x = -widest_left_x
-            start_y = -top_till_text
+    def meets_targets(w, h, target_width, target_height):
+        """Check w and h against (optional) targets."""
+        if target_height:
+            if h > target_height:
+                return False
+        if target_width:
+            if w > target_width:
+                return False
+        return True
+
+    def metrics_size(f, t):
+        """Get (width, height) of t's box in font f's metrics."""
+        return ink_box_metrics(f, t)[:2]
+
+    def coverage_size(f, t):
+        """Get (width, height) of all pixels t's glyph mask covers at all."""
+        box = f.getmask(t, mode="L").getbbox()
+        if box is None:
+            return 0, 0
+        left, top, right, bottom = box
+        return (right - 1) - left, (bottom - 1) - top
+
+    def calibrate_font(t, target_width, target_height, padding, max_size):
+        """Find the font the linear walk stops at, rendering few probes.
+
+        Font metrics and the text's coverage mask both box every pixel of
+        ink the backends find, so sizes whose boxes meet the targets meet
+        them rendered too. Sizes are walked with the cheapest box first,
+        each next one only from the first size the one before misses on.
+        Probes are rendered from the last size known to fit.
+        """
+        p_t, p_b, p_l, p_r = padding
+
+        def fits(w, h):
+            return meets_targets(
+                w + p_l + p_r,
+                h + p_t + p_b,
+                target_width,
+                target_height
+            )
 
-            return width, height, start_x, start_y
+        bounds = [metrics_size]
+        if ink_box is not None:
+            bounds.append(coverage_size)
+        size = 1
+        for bound in bounds:
+            while max_size is None or size <= max_size:
+                if not fits(*bound(get_font(font_name, size), t)):
+                    break
+                size += 1
+
+        measurement = None
+        probes = 0
+        size = max(size - 1, 1)
+        while max_size is None or size <= max_size:
+            m = padded_size_with_font(t, get_font(font_name, size), padding)
+            probes += 1
+            if not meets_targets(m[0], m[1], target_width, target_height):
+                break
+            measurement = m
+            size += 1
+        if measurement is None:
+            raise ValueError(repr(t) + " does not fit its targets")
+
+        # Render like the linear walk, at the size right past the fit found
+        return get_font(font_name, size), measurement, probes
 
-    width = height = 1000
-    tmp = Image.new(default_color_mode, (width, height), transparent_col)
-    tmp_draw = ImageDraw.Draw(tmp)
     tps = []
     min_width = min_height = 0
     text_fill_col = white_col
@@ -177,14 +386,62 @@ def determine_min_image_size(
         # Set target_width or target_height based on text
         target_width = t.target_width
         target_height = t.target_height
-        p_t, p_b, p_l, p_r = t.padding
         str_text = str(t)
+        probes = 0
         if font_size is None:
             fonts = generate_fonts(font_name)
         else:
-            fonts = [ImageFont.truetype(font_name, font_size)]
+            fonts = [get_font(font_name, font_size)]
 
         # Calibrate font such that target width or height are met (or undermet)
+        try:
+            max_size = render_font.size
+        except AttributeError:
+            max_size = None
+
+        cached = None
+        if measure_index is not None:
+            if font_size is not None:
+                size_mode = "size " + str(font_size)
+            elif max_size is not None:
+                size_mode = "max " + str(max_size)
+            else:
+                size_mode = "auto"
+            index_key = (
+                str_text,
+                font_name,
+                size_mode,
+                calibration,
+                measure,
+                target_width,
+                target_height,
+                t.padding
+            )
+            cached = measure_index.get(*index_key)
+            if cached is None:
+                instrument.count("measure_index_misses")
+            else:
+                instrument.count("measure_index_hits")
+
+        if cached is not None:
+            t_width, t_height, t_start_x, t_start_y, cached_size = cached
+            f = get_font(font_name, cached_size)
+            fonts = []
+        elif (
+            font_size is None and
+            calibration == log_calibration and
+            (target_width or target_height or max_size is not None)
+        ):
+            f, measurement, probes = calibrate_font(
+                str_text,
+                target_width,
+                target_height,
+                t.padding,
+                max_size
+            )
+            t_width, t_height, t_start_x, t_start_y = measurement
+            fonts = []
+
         for f in fonts:
             try:
                 if f.size > render_font.size:
@@ -192,28 +449,30 @@ def determine_min_image_size(
             except AttributeError:
                 pass
 
-            w, h, sx, sy = image_size_with_font(str_text, f)
-
-            w += p_l + p_r
-            h += p_t + p_b
-            sx += p_l
-            sy += p_t
-            if target_height:
-                if h > target_height:
-                    break
-            if target_width:
-                if w > target_width:
-                    break
+            w, h, sx, sy = padded_size_with_font(str_text, f, t.padding)
+            probes += 1
+            if not meets_targets(w, h, target_width, target_height):
+                break
 
             t_width = w
             t_height = h
             t_start_x = sx
             t_start_y = sy
 
+        if measure_index is not None and cached is None:
+            measure_index.put(
+                *index_key,
+                width=t_width,
+                height=t_height,
+                sx=t_start_x,
+                sy=t_start_y,
+                font_size=f.size
+            )
+
         # Set render font to lowest value so far
         render_font = f if render_font is None else render_font
         if f.size < render_font.size:
-            render_font = f.size
+            render_font = f
 
         # Set text height and width to targets (if exists)
         if target_height:
@@ -225,6 +484,8 @@ def determine_min_image_size(
         t.height = t_height
         t.sx = t_start_x
         t.sy = t_start_y
+        t.probes = probes
+        instrument.count("font_probes", probes)
         tps.append(t)
 
         # Add text seperation based on image orientation
@@ -246,6 +507,63 @@ def determine_min_image_size(
     return min_width, min_height, tps, render_font
 
 
+def scale_text(text, scale):
+    """Copy text with targets and padding scaled by scale."""
+    def scaled(v):
+        return v and max(floor(v * scale), 1)
+
+    return [
+        ImageText(
+            str(t),
+            target_width=scaled(t.target_width),
+            target_height=scaled(t.target_height),
+            padding=[floor(p * scale) for p in t.padding],
+            color=t.color
+        )
+        for t in text
+    ]
+
+
+def determine_final_size_layout(
+    text,
+    final_size,
+    require_even=False,
+    font_size=None,
+    **kwargs
+):
+    """Determine layout of text at the scale fitting it into final_size.
+
+    The text is measured at its own targets first, then measured again
+    with targets, padding and font_size scaled by the factor fitting that
+    layout into final_size. Font sizes are whole numbers, so the second
+    layout can come out slightly off; while it exceeds final_size it is
+    measured again with a smaller factor. kwargs are passed on to
+    determine_min_image_size, the result is in its form.
+    """
+    f_w, f_h = final_size
+    width, height = determine_min_image_size(
+        text,
+        font_size=font_size,
+        **kwargs
+    )[:2]
+    scale = min(f_w / width, f_h / height)
+    for _ in range(final_size_passes):
+        scaled_size = font_size and max(floor(font_size * scale), 1)
+        layout = determine_min_image_size(
+            scale_text(text, scale),
+            font_size=scaled_size,
+            **kwargs
+        )
+        width, height = layout[:2]
+        if require_even:
+            width += width % 2
+            height += height % 2
+        if width <= f_w and height <= f_h:
+            return layout
+        scale *= min(f_w / width, f_h / height)
+    raise ValueError(repr(text) + " does not fit into " + repr(final_size))
+
+
 def strip_px(s):
     """Remove px from size definition."""
     px = "px"
@@ -261,24 +579,42 @@ def create_image(
     mode=default_color_mode,
     fname="tmp",
     ext=None,
-    convert_to_svg=False
+    convert_to_svg=False,
+    tracer=shell_tracer,
+    in_memory=False,
+    encoder_profile=None,
+    writer=None
 ):
-    """Create blank image of certain width, height and col."""
+    """Create blank image of certain width, height and col.
+
+    With in_memory the image is not saved but returned under img_key of
+    the ImageProps (see save_img). encoder_profile and writer are passed
+    to encoders.save_image.
+    """
     if ext is None:
         ext = environ["default_img_format"]
+    if in_memory and convert_to_svg:
+        raise ValueError("in memory images can not be converted to svg")
     img = Image.new(mode, (width, height), col)
+    if in_memory:
+        return ImageProps(fname, ext, width, height, **{img_key: img})
     if convert_to_svg:
         img = Image.new(mode, (width, height), black_col)
-    img.save(fname + ext)
-
+        if tracer != shell_tracer:
+            ext = svg_convert(fname, ext, col, tracer=tracer, image=img)
+            return ImageProps(fname, ext, width, height)
     if convert_to_svg:
+        ext = encoders.intermediate_ext(ext, encoder_profile)
+        img.save(fname + ext)
         ext = svg_convert(fname, ext, col)
+    else:
+        encoders.save_image(img, fname + ext, ext, encoder_profile, writer)
 
     return ImageProps(fname, ext, width, height)
 
 
-def concat_images(horizontal, img1, img2, margin=None, **kwargs):
-    """Concatenate two svgs."""
+def concat_images_command(horizontal, img1, img2, margin=None, **kwargs):
+    """Get svg_concat command joining two svgs and the resulting props."""
     # Beef up Kwargs
     direction = "v"
     if horizontal:
@@ -308,7 +644,6 @@ def concat_images(horizontal, img1, img2, margin=None, **kwargs):
     imgs = [img1, img2]
     for i in imgs:
         c.append(i[fname_key] + i[ext_key])
-    subprocess.run(c)
 
     # Create resulting Image Properties
     concat_image_props = kwargs
@@ -319,47 +654,241 @@ def concat_images(horizontal, img1, img2, margin=None, **kwargs):
     for a in additive_keys:
         concat_image_props[a] = img1[a] + img2[a]
 
-    return ImageProps(**concat_image_props)
+    return c, ImageProps(**concat_image_props)
+
+
+@instrument.timed("concat_images")
+def concat_images(horizontal, img1, img2, margin=None, **kwargs):
+    """Concatenate two svgs."""
+    c, props = concat_images_command(
+        horizontal,
+        img1,
+        img2,
+        margin,
+        **kwargs
+    )
+    instrument.count("subprocesses")
+    subprocess.run(c)
+    return props
+
+
+def stack_images(horizontal, imgs, fragments=None, margin=None, **kwargs):
+    """Stack any number of svgs in one pass, writing the result once.
+
+    fragments holds the svg documents of imgs. Missing ones (None) are read
+    from the image files, which are removed afterwards as svg_concat does.
+    The resulting width and height add up along the stacking direction.
+    """
+    if fragments is None:
+        fragments = [None] * len(imgs)
+
+    optional_kwargs = {
+        fname_key: "".join(i[fname_key] for i in imgs),
+        ext_key: imgs[0][ext_key]
+    }
+    for k, v in optional_kwargs.items():
+        try:
+            kwargs[k]
+        except KeyError:
+            kwargs[k] = v
 
+    for k, v in imgs[0].items():
+        try:
+            kwargs[k]
+        except KeyError:
+            kwargs[k] = v
 
-def rotate_img(amount, expand=True, width_pad=0, height_pad=0, **img_props):
-    """Rotate image "amount" degrees."""
+    # Collect documents, reading the ones not held in memory
+    dest = kwargs[fname_key] + kwargs[ext_key]
+    docs = []
+    read = []
+    for i, svg in zip(imgs, fragments):
+        if svg is None:
+            img_fname = i[fname_key] + i[ext_key]
+            with open(img_fname) as f:
+                svg = f.read()
+            read.append(img_fname)
+        docs.append(svg)
+
+    margin = float(margin or 0)
+    if margin.is_integer():
+        margin = int(margin)
+    sizes = [(i[width_key], i[height_key]) for i in imgs]
+    with instrument.stage("concat"):
+        svg, width, height = stack_svgs(horizontal, docs, sizes, margin)
+        with open(dest, "w") as f:
+            f.write(svg)
+    instrument.count_file_size(dest)
+    for img_fname in read:
+        if img_fname != dest:
+            os.remove(img_fname)
+
+    kwargs[width_key] = width
+    kwargs[height_key] = height
+    return ImageProps(**kwargs)
+
+
+def load_img(img):
+    """Get PIL image of a PIL image or encoded image bytes."""
+    if isinstance(img, (bytes, bytearray)):
+        img = Image.open(BytesIO(img))
+        img.load()
+    return img
+
+
+def save_img(dest=None, encoder_profile=None, **img_props):
+    """Encode the in memory image of img_props once.
+
+    dest is a path or a writable file-like object, fname + ext by default.
+    Returns the image props without the in memory image.
+    """
+    img_props = ImageProps(**img_props)
+    img = load_img(img_props[img_key])
+    del img_props[img_key]
+    ext = img_props[ext_key]
+    if dest is None:
+        dest = img_props[fname_key] + ext
+    encoders.save_image(img, dest, ext, encoder_profile)
+    return img_props
+
+
+def encode_img(encoder_profile=None, **img_props):
+    """Get encoded bytes of the in memory image of img_props."""
+    buf = BytesIO()
+    save_img(buf, encoder_profile, **img_props)
+    return buf.getvalue()
+
+
+@instrument.timed("rotate_img")
+def rotate_img(
+    amount,
+    expand=True,
+    width_pad=0,
+    height_pad=0,
+    encoder_profile=None,
+    writer=None,
+    **img_props
+):
+    """Rotate image "amount" degrees.
+
+    Right angle rotations are exact transposes. Other angles rotate once
+    into the expanded bounding box (or the original size without expand),
+    filling uncovered corners with the background color. width_pad and
+    height_pad extend the result to the right and bottom.
+
+    Images held in memory under img_key (PIL images or encoded bytes) are
+    rotated without touching the file system and returned the same way.
+    Files are saved with encoders.save_image; a write still queued on
+    writer is waited for before the file is read.
+    """
     background_color = img_props[back_col_key]
-    width = img_props[width_key]
-    height = img_props[height_key]
     img_fname = img_props[fname_key] + img_props[ext_key]
 
-    original = Image.open(img_fname)
-    max_dim = max(width, height)
-    buff = 5
-    square = Image.new(
-        default_color_mode,
-        (max_dim + buff * 2, max_dim + buff * 5),
-        background_color
-    )
-    square.paste(
-        original,
-        (
-            (max_dim - width) // 2 + buff,
-            (max_dim - height) // 2 + buff
+    in_memory = img_key in img_props
+    if in_memory:
+        original = load_img(img_props[img_key])
+    else:
+        if writer is not None:
+            writer.wait_for(img_fname)
+        original = Image.open(img_fname)
+    if original.mode != default_color_mode:
+        original = original.convert(default_color_mode)
+
+    if expand and amount % 90 == 0:
+        quarter_turns = int(amount // 90) % 4
+        if quarter_turns:
+            transpositions = [
+                None,
+                Image.ROTATE_90,
+                Image.ROTATE_180,
+                Image.ROTATE_270
+            ]
+            rotated = original.transpose(transpositions[quarter_turns])
+        else:
+            rotated = original
+    else:
+        rotated = original.rotate(
+            amount,
+            expand=expand,
+            fillcolor=background_color
         )
-    )
-    square = square.rotate(amount, expand=expand)
 
-    blank_img = Image.new(
-        default_color_mode,
-        (height + width_pad, width + height_pad),
-        background_color
-    )
-    blank_img.paste(square, (-(max_dim - height) // 2 - buff, -buff))
+    if width_pad or height_pad:
+        w, h = rotated.size
+        padded = Image.new(
+            default_color_mode,
+            (w + width_pad, h + height_pad),
+            background_color
+        )
+        padded.paste(rotated, (0, 0))
+        rotated = padded
 
-    img_props[width_key], img_props[height_key] = blank_img.size
-    blank_img.save(img_fname)
+    img_props[width_key], img_props[height_key] = rotated.size
+    if in_memory:
+        img_props[img_key] = rotated
+    else:
+        encoders.save_image(
+            rotated,
+            img_fname,
+            img_props[ext_key],
+            encoder_profile,
+            writer
+        )
     return ImageProps(**img_props)
 
 
-def svg_convert(fname, ext, svg_col=None, skip_remove=False, rename=""):
-    """Convert fname to svg."""
+def trace_image(im, svg_col=None, tracer=python_tracer):
+    """Trace PIL image to an svg document with an in process tracer."""
+    if svg_col:
+        svg_col = encode_hex_col(svg_col)
+    return tracers[tracer](im, svg_col)
+
+
+@instrument.timed("svg_convert")
+def svg_convert(
+    fname,
+    ext,
+    svg_col=None,
+    skip_remove=False,
+    rename="",
+    tracer=shell_tracer,
+    image=None
+):
+    """Convert fname to svg.
+
+    tracer picks the implementation: shell_tracer runs the convert_to_svg
+    script, potrace_tracer pipes the bitmap through a single potrace
+    process and python_tracer traces pixel outlines without external
+    binaries. The in process tracers take image (a PIL image) instead of
+    reading fname + ext when it is given.
+    """
+    if tracer != shell_tracer:
+        if image is None:
+            with Image.open(fname + ext) as image:
+                image.load()
+            if not skip_remove:
+                os.remove(fname + ext)
+        with instrument.stage("trace"):
+            svg = trace_image(image, svg_col, tracer)
+        with open((rename or fname) + ".svg", "w") as f:
+            f.write(svg)
+        instrument.count_file_size((rename or fname) + ".svg")
+        return ".svg"
+
+    c = svg_convert_command(fname, ext, svg_col, skip_remove, rename)
+    instrument.count("subprocesses")
+    subprocess.run(c)
+    return ".svg"
+
+
+def svg_convert_command(
+    fname,
+    ext,
+    svg_col=None,
+    skip_remove=False,
+    rename=""
+):
+    """Get convert_to_svg command tracing fname + ext."""
     c = ["convert_to_svg", fname + ext]
     if svg_col:
         c.append("-c")
@@ -369,24 +898,96 @@ def svg_convert(fname, ext, svg_col=None, skip_remove=False, rename=""):
     if rename:
         c.append("-r")
         c.append(rename)
+    return c
 
-    subprocess.run(c)
+
+def trace_layers(
+    fname,
+    masks,
+    width,
+    height,
+    tracer=python_tracer,
+    ext=".png"
+):
+    """Trace color masks once each and layer them into fname.svg.
+
+    masks maps svg colors to "L" images in which text is drawn with 255.
+    """
+    layers = []
+    for i, (col, mask) in enumerate(masks.items()):
+        layer = ImageOps.invert(mask)
+        if tracer == shell_tracer:
+            tmp_fname = "tmp_layer" + str(i)
+            layer.save(tmp_fname + ext)
+            svg_convert(tmp_fname, ext, col)
+            with open(tmp_fname + ".svg") as f:
+                layers.append(f.read())
+            os.remove(tmp_fname + ".svg")
+        else:
+            layers.append(trace_image(layer, col, tracer))
+
+    svg = compose_svgs(
+        [(layer, 0, 0, width, height) for layer in layers],
+        width,
+        height
+    )
+    with open(fname + ".svg", "w") as f:
+        f.write(svg)
     return ".svg"
 
 
-def add_border_to_img(im, col):
-    """Add border to py pillow obj."""
-    width, height = im.size
+def add_border_to_img(im, col, box=None):
+    """Add border to py pillow obj (around box if given)."""
+    left, top, right, bottom = box or (0, 0) + im.size
     pixels = im.load()
-    for x in range(width):
-        pixels[x, 0] = col
-        pixels[x, height - 1] = col
+    for x in range(left, right):
+        pixels[x, top] = col
+        pixels[x, bottom - 1] = col
+
+    for y in range(top, bottom):
+        pixels[left, y] = col
+        pixels[right - 1, y] = col
+
+
+def place_lines(
+    wh,
+    width,
+    text_seperation,
+    horizontal=False,
+    require_even=False,
+    start_width=0,
+    start_height=0,
+    restart=False
+):
+    """Yield (xy, advance) of each measured line of wh as it is drawn.
 
-    for y in range(height):
-        pixels[0, y] = col
-        pixels[width - 1, y] = col
+    advance is how far the line moves the next one along: its size plus
+    the seperation after it (1 after the last with require_even). With
+    restart every line is placed at the start, as when drawn on an image
+    of its own.
+    """
+    curr_height = start_height
+    curr_width = start_width
+    last_index = len(wh) - 1
+    for i, (t, tw, th, sx, sy, col) in enumerate(wh):
+        if restart:
+            curr_width = curr_height = 0
+        size = tw if horizontal else th
+        advance = size
+        if i < last_index:
+            advance += text_seperation(size)
+        elif require_even:
+            advance += 1
+
+        if horizontal:
+            yield (sx + curr_width, sy), advance
+            curr_width += advance
+        else:
+            yield (sx + (width - tw) / 2, sy + curr_height), advance
+            curr_height += advance
 
 
+@instrument.timed("make_lean_image")
 def make_lean_image(
     fname,
     text,
@@ -405,17 +1006,127 @@ def make_lean_image(
     image_props=None,
     horizontal=False,
     add_border=True,
+    calibration=linear_calibration,
+    measure=bbox_measure,
+    measure_index=None,
+    tracer=shell_tracer,
+    svg_stacking=pairwise_stacking,
+    svg_mode=lines_svg,
+    glyph_cache=None,
+    in_memory=False,
+    output_cache=None,
+    glyph_atlas=None,
+    final_size_mode=resize_final_size,
+    encoder_profile=None,
+    writer=None,
 ):
-    """Make image which is just large enough to contain text."""
+    """Make image which is just large enough to contain text.
+
+    With convert_to_svg and svg_mode lines_svg every line is traced
+    separately. svg_stacking chooses how the traced lines are joined:
+    pairwise_stacking folds them together with concat_images,
+    single_stacking composes all of them at once with stack_images.
+
+    svg_mode layers_svg lays the lines out as for raster output, draws
+    them into one mask per svg color and traces each mask once. glyphs_svg
+    uses the same layout but places outlines of the individual glyphs from
+    glyph_cache (the shared svg_glyphs.glyph_cache by default), tracing
+    only glyphs it has not seen yet.
+
+    With in_memory raster images are not saved but returned under img_key
+    of the ImageProps, ready for rotate_img and save_img.
+
+    output_cache (an OutputCache) is looked up before rendering; on a hit
+    the cached file is placed at fname + ext and its props returned. Saved
+    outputs are added to it. It is not used with in_memory or image_props,
+    nor when an input (such as a text_seperation closing over an arbitrary
+    object) has no deterministic digest.
+
+    glyph_atlas (a GlyphAtlas) draws raster text from cached glyph masks
+    instead of rendering every line with ImageDraw.text.
+
+    final_size centers raster images on a transparent canvas of that
+    size. With final_size_mode resize_final_size the image is rendered at
+    its own size and resized; with direct_final_size the text is laid out
+    at the scale fitting final_size (see determine_final_size_layout) and
+    drawn once, straight onto the canvas. direct_final_size needs the text
+    to be measured, so with image_props it resizes as well.
+
+    encoder_profile (an encoders.EncoderProfile, the global one by
+    default) holds the save options and the type of temporary files
+    traced by the shell tracer. With writer (an encoders.WriteBehind) the
+    raster output is saved in the background; it is complete once
+    writer.wait_for(fname + ext) or writer.flush() returns.
+    """
+    if in_memory and convert_to_svg:
+        raise ValueError("in memory images can not be converted to svg")
+    if ext is None:
+        ext = environ["default_img_format"]
+    cache_key = None
+    if output_cache is not None and image_props is None and not in_memory:
+        cache_key = output_cache.make_key(
+            text=[
+                (str(t), t.target_width, t.target_height, t.padding, t.color)
+                for t in text
+            ],
+            background_color=background_color,
+            text_color=text_color,
+            font_name=font_name,
+            font_size=font_size,
+            ext=ext,
+            convert_to_svg=convert_to_svg,
+            require_even=require_even,
+            final_size=final_size,
+            svg_col=svg_col,
+            start_height=start_height,
+            start_width=start_width,
+            text_seperation=text_seperation,
+            horizontal=horizontal,
+            add_border=add_border,
+            tracer=tracer,
+            svg_stacking=svg_stacking,
+            svg_mode=svg_mode,
+            final_size_mode=final_size_mode,
+            encoder_profile=encoders.get_profile(encoder_profile),
+            calibration=calibration,
+            measure=measure,
+            glyph_atlas=glyph_atlas is not None
+        )
+    if cache_key is not None:
+        cached = output_cache.get(cache_key, fname)
+        if cached is not None:
+            return [ImageProps(**cached)]
+
+    direct = (
+        final_size and
+        final_size_mode == direct_final_size and
+        image_props is None and
+        not convert_to_svg
+    )
+
     # Determine Image Width and Height
     if image_props is None:
         kargs = dict(
             text_seperation=text_seperation,
             font_name=font_name,
             font_size=font_size,
-            horizontal=horizontal
+            horizontal=horizontal,
+            calibration=calibration,
+            measure=measure,
+            measure_index=measure_index
         )
-        width, height, wh, image_font = determine_min_image_size(text, **kargs)
+        if direct:
+            width, height, wh, image_font = determine_final_size_layout(
+                text,
+                final_size,
+                require_even,
+                **kargs
+            )
+        else:
+            width, height, wh, image_font = determine_min_image_size(
+                text,
+                **kargs
+            )
 
     else:
         width, height, wh, image_font = image_props
@@ -425,43 +1136,67 @@ def make_lean_image(
         if height % 2:
             height += 1
 
+    # Where the image goes on the final canvas
+    origin_x = origin_y = 0
+    if direct:
+        f_w, f_h = final_size
+        origin_x, origin_y = (f_w - width) // 2, (f_h - height) // 2
+        box = (origin_x, origin_y, origin_x + width, origin_y + height)
+
     # Draw Image
-    if ext is None:
-        ext = environ["default_img_format"]
-    curr_height = start_height
-    curr_width = start_width
-    if not convert_to_svg:
+    tmp_ext = encoders.intermediate_ext(ext, encoder_profile)
+    layered = convert_to_svg and svg_mode == layers_svg
+    glyphs = convert_to_svg and svg_mode == glyphs_svg
+    per_line_svg = convert_to_svg and not (layered or glyphs)
+    masks = {}
+    runs = []
+    if direct:
+        im = Image.new(default_color_mode, final_size, transparent_col)
+        im.paste(background_color, box)
+        d = ImageDraw.Draw(im)
+    elif not convert_to_svg:
         im = Image.new(default_color_mode, (width, height), background_color)
         d = ImageDraw.Draw(im)
     previous_image = None
+    stacked = []
+    fragments = []
     last_index = len(wh) - 1
-    for i, (t, tw, th, sx, sy, col) in enumerate(wh):
-        if convert_to_svg:
-            curr_width = curr_height = 0
-
-        if horizontal:
-            dims = (sx + curr_width, sy)
-            curr_width += tw
-            if i < last_index:
-                curr_width += text_seperation(tw)
-            else:
-                if require_even:
-                    curr_width += 1
-
-        else:
-            dims = (sx + (width - tw) / 2, sy + curr_height)
-            curr_height += th
-            if i < last_index:
-                curr_height += text_seperation(th)
-            else:
-                if require_even:
-                    curr_height += 1
+    placed = place_lines(
+        wh,
+        width,
+        text_seperation,
+        horizontal,
+        require_even,
+        start_width,
+        start_height,
+        restart=per_line_svg
+    )
+    for i, ((t, tw, th, sx, sy, col), (dims, advance)) in enumerate(
+        zip(wh, placed)
+    ):
+        if direct:
+            dims = (dims[0] + origin_x, dims[1] + origin_y)
+
+        if glyphs:
+            col = col or svg_col
+            runs.append((dims[0], dims[1], t, col and encode_hex_col(col)))
+            continue
+
+        if layered:
+            col = col or svg_col
+            try:
+                mask = masks[col]
+            except KeyError:
+                mask = masks[col] = Image.new("L", (width, height), 0)
+            with instrument.stage("draw"):
+                ImageDraw.Draw(mask).text(dims, t, font=image_font, fill=255)
+            continue
 
         if convert_to_svg:
-            if curr_height == 0:
-                curr_height = height
-            if curr_width == 0:
-                curr_width = width
+            if horizontal:
+                curr_width, curr_height = advance or width, height
+            else:
+                curr_width, curr_height = width, advance or height
             im = Image.new(
                 default_color_mode,
                 (curr_width, curr_height),
@@ -478,17 +1213,48 @@ def make_lean_image(
             if not col:
                 img_col = text_color
 
-        d.text(dims, t, font=image_font, fill=img_col)
+        with instrument.stage("draw"):
+            if glyph_atlas is not None and not convert_to_svg:
+                glyph_atlas.draw(im, dims, t, image_font, img_col)
+            else:
+                d.text(dims, t, font=image_font, fill=img_col)
 
         if convert_to_svg:
             tmp_fname = "tmp" + str(i)
+            if add_border:
+                add_border_to_img(im, background_color)
+
+            if svg_stacking == single_stacking:
+                if tracer == shell_tracer:
+                    im.save(tmp_fname + tmp_ext)
+                    svg_convert(tmp_fname, tmp_ext, col)
+                    fragments.append(None)
+                else:
+                    with instrument.stage("trace"):
+                        fragments.append(trace_image(im, col, tracer))
+                stacked.append(ImageProps(
+                    tmp_fname,
+                    ".svg",
+                    curr_width,
+                    curr_height,
+                    **{back_col_key: background_color}
+                ))
+                continue
+
             if i == last_index and not previous_image:
                 tmp_fname = fname
 
-            if add_border:
-                add_border_to_img(im, background_color)
-            im.save(tmp_fname + ext)
-            svg_ext = svg_convert(tmp_fname, ext, col)
+            if tracer == shell_tracer:
+                im.save(tmp_fname + tmp_ext)
+                svg_ext = svg_convert(tmp_fname, tmp_ext, col)
+            else:
+                svg_ext = svg_convert(
+                    tmp_fname,
+                    ext,
+                    col,
+                    tracer=tracer,
+                    image=im
+                )
             ip = ImageProps(
                 tmp_fname,
                 svg_ext,
@@ -509,35 +1275,84 @@ def make_lean_image(
                 previous_image = ip
             ret = previous_image
 
+    if glyphs:
+        if glyph_cache is None:
+            glyph_cache = svg_glyphs.glyph_cache
+        with instrument.stage("trace"):
+            svg = svg_glyphs.glyphs_to_svg(
+                runs,
+                image_font,
+                width,
+                height,
+                glyph_cache
+            )
+        with open(fname + ".svg", "w") as f:
+            f.write(svg)
+        instrument.count_file_size(fname + ".svg")
+        ret = ImageProps(
+            fname,
+            ".svg",
+            width,
+            height,
+            **{back_col_key: background_color}
+        )
+    elif layered:
+        with instrument.stage("trace"):
+            svg_ext = trace_layers(
+                fname,
+                masks,
+                width,
+                height,
+                tracer,
+                tmp_ext
+            )
+        ret = ImageProps(
+            fname,
+            svg_ext,
+            width,
+            height,
+            **{back_col_key: background_color}
+        )
+    elif convert_to_svg and svg_stacking == single_stacking:
+        ret = stack_images(
+            horizontal,
+            stacked,
+            fragments,
+            **{fname_key: fname}
+        )
+
     # Save image and optionally convert to svg
     if not convert_to_svg:
         if add_border:
-            add_border_to_img(im, background_color)
+            add_border_to_img(im, background_color, box if direct else None)
 
-        if final_size:
+        if direct:
+            width, height = final_size
+        elif final_size:
             s = (width, height)
             f_w, f_h = final_size
             i = final_size.index(min(final_size))
             scale_factor = final_size[i] / s[i]
 
-            print(i, scale_factor, width, height)
             s_w, s_h = (ceil(width * scale_factor), ceil(height * scale_factor))
             im = im.resize((s_w, s_h))
 
-            print("final", (f_w, f_h), "scaled", (s_w, s_h), "position", ((f_w - s_w) // 2, (f_h - s_h) // 2))
             true_final_img = Image.new(default_color_mode, (f_w, f_h), transparent_col)
             true_final_img.paste(im, ((f_w - s_w) // 2, (f_h - s_h) // 2))
 
             im = true_final_img
             width, height = final_size
 
-        im.save(fname + ext)
-        ret = ImageProps(
-            fname,
-            ext,
-            width,
-            height,
-            **{back_col_key: background_color}
-        )
-
+        props = {back_col_key: background_color}
+        if in_memory:
+            props[img_key] = im
+        else:
+            encoders.save_image(im, fname + ext, ext, encoder_profile, writer)
+        ret = ImageProps(fname, ext, width, height, **props)
+
+    if cache_key is not None:
+        artifact = ret[fname_key] + ret[ext_key]
+        if writer is not None:
+            writer.wait_for(artifact)
+        output_cache.put(cache_key, artifact, ret)
     return [ret]
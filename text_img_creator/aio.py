@@ -0,0 +1,297 @@
+"""asyncio variants of make_lean_image and the helpers it runs.
+
+External tools run through asyncio.create_subprocess_exec and at most
+process_limit processes (convert_to_svg, svg_concat, potrace) run at once
+per event loop. Drawing, measuring and the in process tracers run on an
+executor: the one passed per call, else the one given to set_executor,
+else the loop's default executor.
+"""
+import asyncio
+import os
+from functools import partial
+from inspect import signature
+from uuid import uuid4
+from weakref import WeakKeyDictionary
+from text_img_creator import (
+    back_col_key,
+    concat_images_command,
+    determine_min_image_size,
+    encoders,
+    img_key,
+    instrument,
+    lines_svg,
+    pairwise_stacking,
+    place_lines,
+    potrace_tracer,
+    python_tracer,
+    shell_tracer,
+    single_stacking,
+    stack_images,
+    svg_convert_command,
+)
+from text_img_creator import make_lean_image as sync_make_lean_image
+from text_img_creator import rotate_img as sync_rotate_img
+from text_img_creator import svg_convert as sync_svg_convert
+from text_img_creator.img_utils import ImageProps
+
+default_process_limit = os.cpu_count() or 1
+
+_process_limit = default_process_limit
+_slots = WeakKeyDictionary()
+_executor = None
+
+
+def set_process_limit(limit):
+    """Set how many external processes run at once.
+
+    Takes effect for event loops which have not started a process yet.
+    """
+    global _process_limit
+    _process_limit = limit
+    _slots.clear()
+
+
+def set_executor(executor):
+    """Set executor for CPU bound work (None for the loop's default)."""
+    global _executor
+    _executor = executor
+
+
+def process_slots():
+    """Get semaphore bounding the processes of the running loop."""
+    loop = asyncio.get_running_loop()
+    try:
+        return _slots[loop]
+    except KeyError:
+        pass
+    slots = _slots[loop] = asyncio.Semaphore(_process_limit)
+    return slots
+
+
+async def run_in_executor(func, *args, executor=None, **kwargs):
+    """Run func(*args, **kwargs) on executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or _executor,
+        partial(func, *args, **kwargs)
+    )
+
+
+async def run_command(c):
+    """Run command c once a process slot is free, returning its status."""
+    async with process_slots():
+        instrument.count("subprocesses")
+        process = await asyncio.create_subprocess_exec(*c)
+        return await process.wait()
+
+
+async def svg_convert(
+    fname,
+    ext,
+    svg_col=None,
+    skip_remove=False,
+    rename="",
+    tracer=shell_tracer,
+    image=None,
+    executor=None
+):
+    """Convert fname to svg (see text_img_creator.svg_convert)."""
+    if tracer == shell_tracer:
+        await run_command(
+            svg_convert_command(fname, ext, svg_col, skip_remove, rename)
+        )
+        return ".svg"
+
+    convert = partial(
+        sync_svg_convert,
+        fname,
+        ext,
+        svg_col,
+        skip_remove,
+        rename,
+        tracer,
+        image
+    )
+    if tracer == potrace_tracer:
+        async with process_slots():
+            return await run_in_executor(convert, executor=executor)
+    return await run_in_executor(convert, executor=executor)
+
+
+async def concat_images(horizontal, img1, img2, margin=None, **kwargs):
+    """Concatenate two svgs (see text_img_creator.concat_images)."""
+    c, props = concat_images_command(
+        horizontal,
+        img1,
+        img2,
+        margin,
+        **kwargs
+    )
+    await run_command(c)
+    return props
+
+
+async def rotate_img(
+    amount,
+    expand=True,
+    width_pad=0,
+    height_pad=0,
+    executor=None,
+    **img_props
+):
+    """Rotate image on executor (see text_img_creator.rotate_img)."""
+    return await run_in_executor(
+        sync_rotate_img,
+        amount,
+        expand,
+        width_pad,
+        height_pad,
+        executor=executor,
+        **img_props
+    )
+
+
+async def make_lean_image(fname, text, executor=None, **kwargs):
+    """Make image just large enough to contain text.
+
+    Takes the arguments of text_img_creator.make_lean_image. With
+    convert_to_svg and svg_mode lines_svg the lines are drawn and traced
+    concurrently and joined with svg_concat processes or stack_images;
+    everything else runs as one call on the executor, holding a process
+    slot if it spawns tracers. The output cache is only used that way too.
+    """
+    args = signature(sync_make_lean_image).bind(fname, text, **kwargs)
+    args.apply_defaults()
+    args = args.arguments
+    convert_to_svg = args["convert_to_svg"]
+    tracer = args["tracer"]
+
+    if (
+        convert_to_svg and
+        args["svg_mode"] == lines_svg and
+        args["output_cache"] is None
+    ):
+        return [await make_svg_lines(executor, **args)]
+
+    render = partial(sync_make_lean_image, fname, text, **kwargs)
+    if convert_to_svg and tracer != python_tracer:
+        async with process_slots():
+            return await run_in_executor(render, executor=executor)
+    return await run_in_executor(render, executor=executor)
+
+
+async def make_svg_lines(executor, fname, text, **args):
+    """Trace each line of text at once and join them into fname.svg."""
+    horizontal = args["horizontal"]
+    text_seperation = args["text_seperation"]
+    require_even = args["require_even"]
+    tracer = args["tracer"]
+    background_color = args["background_color"]
+    ext = args["ext"] or os.environ["default_img_format"]
+    tmp_ext = encoders.intermediate_ext(ext, args["encoder_profile"])
+
+    if args["image_props"] is None:
+        layout = await run_in_executor(
+            determine_min_image_size,
+            text,
+            text_seperation,
+            font_name=args["font_name"],
+            font_size=args["font_size"],
+            horizontal=horizontal,
+            calibration=args["calibration"],
+            measure=args["measure"],
+            measure_index=args["measure_index"],
+            executor=executor
+        )
+    else:
+        layout = args["image_props"]
+    width, height, wh, image_font = layout
+    if require_even:
+        width += width % 2
+        height += height % 2
+
+    # Temporary names unique to this call, as calls overlap
+    prefix = "tmp" + uuid4().hex
+    last_index = len(wh) - 1
+    # Each line is traced on an image of its own
+    placed = place_lines(
+        wh,
+        width,
+        text_seperation,
+        horizontal,
+        require_even,
+        restart=True
+    )
+    pairwise = args["svg_stacking"] == pairwise_stacking
+
+    async def trace_line(i, line, size):
+        t, tw, th, sx, sy, col = line
+        if horizontal:
+            line_width, line_height = size or width, height
+        else:
+            line_width, line_height = width, size or height
+
+        tmp_fname = prefix + str(i)
+        if pairwise and last_index == 0:
+            tmp_fname = fname
+        in_memory = tracer != shell_tracer
+        ip, = await run_in_executor(
+            sync_make_lean_image,
+            tmp_fname,
+            None,
+            background_color=background_color,
+            text_color=args["text_color"],
+            ext=tmp_ext,
+            image_props=(
+                line_width,
+                line_height,
+                [(t, tw, th, sx, sy, None)],
+                image_font
+            ),
+            horizontal=horizontal,
+            add_border=args["add_border"],
+            in_memory=in_memory,
+            encoder_profile=args["encoder_profile"],
+            executor=executor
+        )
+        svg_ext = await svg_convert(
+            tmp_fname,
+            tmp_ext,
+            col or args["svg_col"],
+            tracer=tracer,
+            image=ip.get(img_key),
+            executor=executor
+        )
+        return ImageProps(
+            tmp_fname,
+            svg_ext,
+            line_width,
+            line_height,
+            **{back_col_key: background_color}
+        )
+
+    traced = await asyncio.gather(
+        *(
+            trace_line(i, line, size)
+            for i, (line, (_, size)) in enumerate(zip(wh, placed))
+        )
+    )
+
+    if args["svg_stacking"] == single_stacking:
+        return await run_in_executor(
+            stack_images,
+            horizontal,
+            traced,
+            fname=fname,
+            executor=executor
+        )
+
+    ret = traced[0]
+    for i, ip in enumerate(traced[1:], 1):
+        ret = await concat_images(
+            horizontal,
+            ret,
+            ip,
+            fname=fname if i == last_index else prefix + str(i)
+        )
+    return ret
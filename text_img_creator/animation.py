@@ -0,0 +1,322 @@
+"""Render frame sequences of text images as streamed animations."""
+import struct
+from itertools import chain
+from io import BytesIO
+from math import ceil, floor
+from PIL import GifImagePlugin, Image, ImageDraw
+from text_img_creator import (
+    back_col_key,
+    black_col,
+    default_color_mode,
+    determine_min_image_size,
+    frame_fname_base,
+    linear_calibration,
+    place_lines,
+    white_col,
+)
+from text_img_creator.img_utils import (
+    ImageProps,
+    ImageText,
+    png_chunk,
+    png_chunks,
+    png_signature,
+)
+
+frames_key = "frames"
+default_duration = 100
+
+
+class GifWriter:
+    """Stream frames into a GIF, one dirty region at a time.
+
+    The first frame carries the global palette, later regions are written
+    with their own local palette so their colors stay exact.
+    """
+
+    def __init__(self, fp, duration=default_duration, loop=0):
+        """Initialize writer on binary file object fp."""
+        self.fp = fp
+        self.duration = duration
+        self.loop = loop
+        self.started = False
+
+    def add(self, frame, box=None):
+        """Write region box of frame (all of it for the first frame)."""
+        if not self.started:
+            box = (0, 0) + frame.size
+        im = frame.crop(box).convert("RGB").quantize(256, dither=0)
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(
+                im,
+                info={"loop": self.loop, "duration": self.duration}
+            )
+            self.fp.write(b"".join(header))
+
+        self.fp.write(b"".join(GifImagePlugin.getdata(
+            im,
+            box[:2],
+            duration=self.duration,
+            disposal=1,
+            include_color_table=self.started
+        )))
+        self.started = True
+
+    def close(self):
+        """Write trailer."""
+        self.fp.write(b";")
+
+
+class ApngWriter:
+    """Stream frames into an animated PNG, one dirty region at a time.
+
+    Each region is encoded on its own and its image data is rewrapped into
+    fdAT chunks. The frame count is patched into acTL on close, so fp has
+    to be seekable.
+    """
+
+    def __init__(self, fp, duration=default_duration, loop=0):
+        """Initialize writer on binary file object fp."""
+        self.fp = fp
+        self.duration = duration
+        self.loop = loop
+        self.sequence = 0
+        self.frames = 0
+        self.actl_pos = None
+
+    def actl(self):
+        """Create animation control chunk."""
+        return png_chunk(b"acTL", struct.pack(">II", self.frames, self.loop))
+
+    def add(self, frame, box=None):
+        """Write region box of frame (all of it for the first frame)."""
+        if self.actl_pos is None:
+            box = (0, 0) + frame.size
+        region = frame.crop(box)
+        png = BytesIO()
+        region.save(png, "PNG")
+        chunks = list(png_chunks(png.getvalue()))
+
+        if self.actl_pos is None:
+            self.fp.write(png_signature)
+            self.fp.write(png_chunk(b"IHDR", chunks[0][1]))
+            self.actl_pos = self.fp.tell()
+            self.fp.write(self.actl())
+
+        self.fp.write(png_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB",
+            self.sequence,
+            region.width,
+            region.height,
+            box[0],
+            box[1],
+            self.duration,
+            1000,
+            0,
+            0
+        )))
+        self.sequence += 1
+        for kind, data in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames:
+                data = struct.pack(">I", self.sequence) + data
+                kind = b"fdAT"
+                self.sequence += 1
+            self.fp.write(png_chunk(kind, data))
+        self.frames += 1
+
+    def close(self):
+        """Write end chunk and the final frame count."""
+        self.fp.write(png_chunk(b"IEND", b""))
+        end = self.fp.tell()
+        self.fp.seek(self.actl_pos)
+        self.fp.write(self.actl())
+        self.fp.seek(end)
+
+
+animation_writers = {
+    ".gif": GifWriter,
+    ".png": ApngWriter,
+    ".apng": ApngWriter,
+}
+
+
+def union_box(a, b):
+    """Get box containing boxes a and b (either may be None)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (
+        min(a[0], b[0]),
+        min(a[1], b[1]),
+        max(a[2], b[2]),
+        max(a[3], b[3])
+    )
+
+
+def overlap(a, b):
+    """Check whether boxes a and b share any pixel."""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def line_box(font, xy, text, size):
+    """Get box of an image of size text drawn at xy may cover, or None."""
+    left, top, right, bottom = font.getbbox(text)
+    x, y = xy
+    # Widened by a pixel as fractional positions shift the ink
+    box = (
+        max(floor(x) + left - 1, 0),
+        max(floor(y) + top - 1, 0),
+        min(ceil(x) + right + 1, size[0]),
+        min(ceil(y) + bottom + 1, size[1])
+    )
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def repaint(canvas, box, drawn, font, background_color):
+    """Redraw box of canvas from the background and the lines in drawn.
+
+    drawn holds (xy, text, color, box) of each line on canvas. The lines
+    are drawn in a scratch image starting at or before their positions,
+    so they keep their fractional offsets and are rendered as on canvas.
+    """
+    lines = [
+        (xy, t, col) for xy, t, col, b in drawn
+        if b is not None and overlap(b, box)
+    ]
+    x0 = min([box[0]] + [floor(xy[0]) for xy, _, _ in lines])
+    y0 = min([box[1]] + [floor(xy[1]) for xy, _, _ in lines])
+    patch = Image.new(
+        canvas.mode,
+        (box[2] - x0, box[3] - y0),
+        background_color
+    )
+    d = ImageDraw.Draw(patch)
+    for (x, y), t, col in lines:
+        d.text((x - x0, y - y0), t, font=font, fill=col)
+    canvas.paste(
+        patch.crop((box[0] - x0, box[1] - y0, box[2] - x0, box[3] - y0)),
+        box[:2]
+    )
+
+
+def image_texts(lines):
+    """Get lines as a list of ImageText."""
+    return [t if isinstance(t, ImageText) else ImageText(t) for t in lines]
+
+
+def render_animation(
+    fname,
+    frames,
+    background_color=white_col,
+    text_color=black_col,
+    font_name=None,
+    font_size=None,
+    ext=".gif",
+    duration=default_duration,
+    loop=0,
+    frame_ext=None,
+    layout=None,
+    text_seperation=lambda x: 0,
+    horizontal=False,
+    calibration=linear_calibration,
+):
+    """Render a sequence of text states into an animation.
+
+    frames is an iterable of lists of lines (ImageText or str), one list
+    per frame, each with the same number of lines. The layout (image size,
+    font and line slots) is measured once, from layout or else the first
+    frame. Frames are drawn on one canvas, redrawing only the lines that
+    changed, and only the region they cover is passed to the writer for
+    ext (see animation_writers), which encodes it as it goes, so memory
+    does not grow with the number of frames. With
+    frame_ext each frame is also saved as frame_fname_base + N + frame_ext;
+    ext None writes only those files. A frame with a different number of
+    lines than the layout raises ValueError.
+    """
+    frames = iter(frames)
+    first = image_texts(next(frames))
+    if layout is None:
+        layout = first
+    else:
+        layout = image_texts(layout)
+    width, height, wh, image_font = determine_min_image_size(
+        layout,
+        text_seperation,
+        font_name=font_name,
+        font_size=font_size,
+        horizontal=horizontal,
+        calibration=calibration
+    )
+
+    slots = [
+        dims for dims, _ in place_lines(wh, width, text_seperation, horizontal)
+    ]
+
+    writer = None
+    fp = None
+    if ext is not None:
+        fp = open(fname + ext, "wb")
+        writer = animation_writers[ext.lower()](fp, duration, loop)
+
+    try:
+        canvas = Image.new(
+            default_color_mode,
+            (width, height),
+            background_color
+        )
+        drawn = [None] * len(slots)
+        count = 0
+        for lines in chain([first], frames):
+            lines = list(lines)
+            if len(lines) != len(slots):
+                raise ValueError(
+                    "frame " + str(count) + " has " + str(len(lines))
+                    + " lines, the layout has " + str(len(slots))
+                )
+            # Clear and redraw the slots whose line changed, over the ink
+            # of both the old and the new line
+            boxes = []
+            for i, (dims, t) in enumerate(zip(slots, lines)):
+                line = (
+                    dims,
+                    str(t),
+                    getattr(t, "color", None) or text_color
+                )
+                if drawn[i] is not None and drawn[i][:3] == line:
+                    continue
+                box = line_box(image_font, dims, line[1], canvas.size)
+                if drawn[i] is not None:
+                    boxes.append(union_box(box, drawn[i][3]))
+                else:
+                    boxes.append(box)
+                drawn[i] = line + (box,)
+
+            dirty = None
+            for box in boxes:
+                if box is not None:
+                    repaint(canvas, box, drawn, image_font, background_color)
+                    dirty = union_box(dirty, box)
+
+            if writer is not None:
+                writer.add(canvas, dirty or (0, 0, 1, 1))
+            if frame_ext is not None:
+                canvas.save(frame_fname_base + str(count) + frame_ext)
+            count += 1
+
+        if writer is not None:
+            writer.close()
+    finally:
+        if fp is not None:
+            fp.close()
+
+    return ImageProps(
+        fname,
+        ext,
+        width,
+        height,
+        **{back_col_key: background_color, frames_key: count}
+    )
@@ -0,0 +1,134 @@
+"""Render many images on a process pool."""
+import os
+import traceback
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from text_img_creator import make_lean_image
+from text_img_creator.font_cache import get_font
+from text_img_creator.img_utils import ImageText
+from text_img_creator.prop_store import flush_at_worker_exit
+
+BatchResult = namedtuple("BatchResult", ["index", "job", "props", "error"])
+tuple_keys = ["background_color", "text_color", "svg_col", "final_size"]
+
+
+def constant_seperation(pixels, size):
+    """Separate lines by pixels, whatever their size."""
+    return pixels
+
+
+def load_text(spec):
+    """Create ImageText of a string or a dict of ImageText arguments."""
+    if isinstance(spec, str):
+        return ImageText(spec)
+    spec = dict(spec)
+    for k in ["padding", "color"]:
+        if isinstance(spec.get(k), list):
+            spec[k] = tuple(spec[k])
+    return ImageText(**spec)
+
+
+def load_job(spec):
+    """Turn a JSON job spec into make_lean_image keyword arguments.
+
+    text entries are strings or dicts of ImageText arguments, colors and
+    final_size given as lists become tuples and a numeric text_seperation
+    puts that many pixels between lines.
+    """
+    job = dict(spec)
+    job["text"] = [load_text(t) for t in job["text"]]
+    for k in tuple_keys:
+        if isinstance(job.get(k), list):
+            job[k] = tuple(job[k])
+    seperation = job.get("text_seperation")
+    if isinstance(seperation, (int, float)):
+        job["text_seperation"] = partial(constant_seperation, seperation)
+    return job
+
+
+def warm_fonts(fonts):
+    """Load (font_name, size) pairs into the worker's font cache."""
+    for font_name, size in fonts:
+        get_font(font_name, size)
+
+
+def init_worker(fonts=()):
+    """Load fonts and flush buffered image properties on exit."""
+    warm_fonts(fonts)
+    flush_at_worker_exit()
+
+
+def parse_fonts(fonts):
+    """Turn font_name:size strings into (font_name, size) pairs."""
+    pairs = []
+    for font in fonts:
+        font_name, size = font.rsplit(":", 1)
+        pairs.append((font_name, int(size)))
+    return pairs
+
+
+def render_job(job):
+    """Run make_lean_image with job's kwargs, returning (props, error)."""
+    try:
+        return make_lean_image(**job), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def make_lean_images(jobs, workers=None, ordered=True, fonts=(), window=None):
+    """Render job specs on a pool of worker processes.
+
+    jobs is an iterable of make_lean_image keyword arguments (fname, text,
+    font_name, ext, ...); everything in them must be picklable, so pass
+    text_seperation as a module level function rather than a lambda. fonts
+    lists (font_name, size) pairs each worker loads before its first job;
+    later loads come from the worker's font cache.
+
+    Yields a BatchResult per job, in submission order if ordered, else as
+    jobs complete. A failing job reports its traceback in error instead of
+    stopping the batch. At most window jobs (twice the number of workers
+    by default) are in flight, so jobs may be a lazy, unbounded iterable.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if window is None:
+        window = 2 * workers
+
+    jobs = enumerate(jobs)
+    with ProcessPoolExecutor(
+        workers,
+        initializer=init_worker,
+        initargs=(list(fonts),)
+    ) as pool:
+        pending = deque()
+
+        def submit():
+            """Fill the window, returning False once jobs run out."""
+            while len(pending) < window:
+                try:
+                    index, job = next(jobs)
+                except StopIteration:
+                    return False
+                pending.append((index, job, pool.submit(render_job, job)))
+            return True
+
+        def result(index, job, future):
+            """Wrap future's outcome in a BatchResult."""
+            try:
+                props, error = future.result()
+            except Exception:
+                props, error = None, traceback.format_exc()
+            return BatchResult(index, job, props, error)
+
+        more = submit()
+        while pending:
+            if ordered:
+                yield result(*pending.popleft())
+            else:
+                wait([f for _, _, f in pending], return_when=FIRST_COMPLETED)
+                for entry in [e for e in pending if e[2].done()]:
+                    pending.remove(entry)
+                    yield result(*entry)
+            if more:
+                more = submit()
@@ -0,0 +1,179 @@
+"""Render the jobs of a JSON lines manifest from the command line."""
+import argparse
+import json
+import os
+import sys
+import traceback
+from collections import deque
+from text_img_creator.batch import (
+    load_job,
+    make_lean_images,
+    parse_fonts,
+    render_job,
+    warm_fonts
+)
+from text_img_creator.measure_index import MeasureIndex
+from text_img_creator.output_cache import OutputCache
+
+
+def read_manifest(f):
+    """Lazily yield (line number, line) of the non blank manifest lines."""
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            yield number, line
+
+
+def output_path(spec):
+    """Get path of the file job spec renders."""
+    if spec.get("convert_to_svg"):
+        ext = ".svg"
+    else:
+        ext = spec.get("ext") or os.environ["default_img_format"]
+    return spec["fname"] + ext
+
+
+def render_manifest(
+    manifest,
+    out,
+    workers=1,
+    ordered=False,
+    resume=False,
+    fonts=(),
+    caches=None
+):
+    """Render jobs of manifest, writing a result line per job to out.
+
+    Results hold the manifest line number under "line" and either the
+    image "props", an "error" or "skipped" for jobs resume found done.
+    With ordered they are written in manifest order, else errors and skips
+    may come ahead of earlier jobs still running. caches are added to
+    every job not naming its own. Returns the number of failed jobs.
+    """
+    caches = caches or {}
+    failed = 0
+    # Manifest lines of jobs in flight on the pool, by submission index
+    lines = {}
+    # Results found while submitting (parse errors and skips) which in
+    # order go after jobs still in flight
+    held = deque()
+
+    def write(result):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    def report(result):
+        if ordered and lines:
+            held.append(result)
+        else:
+            release()
+            write(result)
+
+    def release(before=None):
+        while held and (before is None or held[0]["line"] < before):
+            write(held.popleft())
+
+    def jobs():
+        nonlocal failed
+        for number, line in read_manifest(manifest):
+            try:
+                spec = json.loads(line)
+                if resume and os.path.exists(output_path(spec)):
+                    report({"line": number, "skipped": True})
+                    continue
+                job = load_job(spec)
+            except Exception:
+                failed += 1
+                report({"line": number, "error": traceback.format_exc()})
+                continue
+            for k, cache in caches.items():
+                job.setdefault(k, cache)
+            yield number, job
+
+    if workers <= 1:
+        results = (
+            (number,) + render_job(job)
+            for number, job in jobs()
+        )
+    else:
+        def submitted():
+            for index, (number, job) in enumerate(jobs()):
+                lines[index] = number
+                yield job
+
+        results = (
+            (lines.pop(r.index), r.props, r.error)
+            for r in make_lean_images(
+                submitted(),
+                workers,
+                ordered,
+                fonts
+            )
+        )
+
+    for number, props, error in results:
+        release(number)
+        if error is None:
+            write({"line": number, "props": dict(props[0])})
+        else:
+            failed += 1
+            write({"line": number, "error": error})
+        if not lines:
+            release()
+    release()
+    return failed
+
+
+def main(argv=None):
+    """Run text_img_creator command."""
+    parser = argparse.ArgumentParser(
+        prog="text_img_creator",
+        description="Render the make_lean_image jobs of a JSON lines "
+                    "manifest, writing a JSON result line per job."
+    )
+    parser.add_argument("manifest", nargs="?", default="-",
+                        help="manifest file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="results file (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="worker processes (default: 1, in process)")
+    parser.add_argument("--ordered", action="store_true",
+                        help="write results in manifest order")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip jobs whose output file exists")
+    parser.add_argument("--font", action="append", default=[],
+                        help="font_name:size to load up front")
+    parser.add_argument("--output-cache", help="output cache directory")
+    parser.add_argument("--measure-index", help="measure index database")
+    args = parser.parse_args(argv)
+
+    caches = {}
+    if args.output_cache:
+        caches["output_cache"] = OutputCache(args.output_cache)
+    if args.measure_index:
+        caches["measure_index"] = MeasureIndex(args.measure_index)
+    fonts = parse_fonts(args.font)
+
+    manifest = sys.stdin if args.manifest == "-" else open(args.manifest)
+    out = sys.stdout if args.output == "-" else open(args.output, "a")
+    try:
+        if args.workers <= 1:
+            warm_fonts(fonts)
+        failed = render_manifest(
+            manifest,
+            out,
+            args.workers,
+            args.ordered,
+            args.resume,
+            fonts,
+            caches
+        )
+    finally:
+        if manifest is not sys.stdin:
+            manifest.close()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
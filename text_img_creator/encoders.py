@@ -0,0 +1,162 @@
+"""Encoder settings for saved images and a write-behind queue saving them.
+
+An EncoderProfile maps PIL format names ("PNG", "WEBP", ...) to keyword
+arguments of Image.save under options. intermediate_ext is the extension
+of the temporary files handed to the convert_to_svg script, None to use
+the output extension; ".bmp" skips compressing files only read once.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from PIL import Image
+from text_img_creator import instrument
+
+EncoderProfile = namedtuple("EncoderProfile", ["options", "intermediate_ext"])
+
+pil_profile = EncoderProfile({}, None)
+fast_profile = EncoderProfile(
+    {
+        "PNG": {"compress_level": 1},
+        "WEBP": {"quality": 80, "method": 0},
+    },
+    ".bmp"
+)
+small_profile = EncoderProfile(
+    {
+        "PNG": {"optimize": True},
+        "WEBP": {"lossless": True, "quality": 100, "method": 6},
+    },
+    None
+)
+
+_profile = pil_profile
+
+
+def set_profile(profile):
+    """Set profile used by calls not passing their own."""
+    global _profile
+    _profile = profile
+
+
+def get_profile(profile=None):
+    """Get profile, the global one if profile is None."""
+    return _profile if profile is None else profile
+
+
+def image_format(ext):
+    """Get PIL format name of file extension ext."""
+    return Image.registered_extensions()[ext.lower()]
+
+
+def encode(im, dest, fmt, options):
+    """Save im to path or file object dest."""
+    with instrument.stage("encode"):
+        im.save(dest, format=fmt, **options)
+    if isinstance(dest, str):
+        instrument.count_file_size(dest)
+
+
+def save_image(im, dest, ext, profile=None, writer=None):
+    """Save im as ext to dest with the options of profile.
+
+    With a writer (a WriteBehind) the image is queued and must not be
+    changed afterwards; the file exists once writer.wait_for(dest) returns.
+    """
+    fmt = image_format(ext)
+    options = get_profile(profile).options.get(fmt, {})
+    if writer is not None:
+        writer.submit(im, dest, fmt, options)
+    else:
+        encode(im, dest, fmt, options)
+
+
+def intermediate_ext(ext, profile=None):
+    """Get extension of temporary files saved for tracing."""
+    return get_profile(profile).intermediate_ext or ext
+
+
+class WriteBehind:
+    """Encode and write images on worker threads.
+
+    Pillow releases the GIL while compressing, so the next image can be
+    drawn meanwhile. submit blocks while max_pending images wait to be
+    written, so queued images do not pile up in memory. Errors are raised
+    by wait_for of the failed path or else by the next flush.
+    """
+
+    def __init__(self, workers=2, max_pending=None):
+        """Initialize queue writing with workers threads."""
+        if max_pending is None:
+            max_pending = 2 * workers
+        self._pool = ThreadPoolExecutor(workers)
+        self._slots = BoundedSemaphore(max_pending)
+        self._pending = {}
+        self._errors = {}
+        self._lock = Lock()
+
+    def submit(self, im, path, fmt, options):
+        """Queue im to be saved to path as fmt."""
+        # Keep writes of one path in order
+        self.wait_for(path)
+        self._slots.acquire()
+        future = self._pool.submit(self._write, im, path, fmt, options)
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(
+            lambda f, path=path: self._forget(path, f)
+        )
+
+    def _forget(self, path, future):
+        """Drop finished future of path."""
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+    def _write(self, im, path, fmt, options):
+        """Save im on a worker thread, keeping errors for the waiters."""
+        try:
+            encode(im, path, fmt, options)
+        except Exception as e:
+            with self._lock:
+                self._errors[path] = e
+        finally:
+            self._slots.release()
+
+    def wait_for(self, path):
+        """Wait until the queued write of path, if any, is done."""
+        with self._lock:
+            future = self._pending.pop(path, None)
+        if future is not None:
+            future.result()
+        with self._lock:
+            error = self._errors.pop(path, None)
+        if error is not None:
+            raise error
+
+    def flush(self):
+        """Wait for all queued writes, raising the first error."""
+        with self._lock:
+            futures = list(self._pending.values())
+            self._pending.clear()
+        for future in futures:
+            future.result()
+        with self._lock:
+            errors = list(self._errors.values())
+            self._errors.clear()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Flush and stop the worker threads."""
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        """Use queue as context manager."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close queue."""
+        self.close()
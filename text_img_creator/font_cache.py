@@ -0,0 +1,112 @@
+"""Process wide cache of loaded FreeType fonts."""
+from collections import namedtuple
+from threading import Lock
+import hashlib
+import os
+from PIL import ImageFont
+from text_img_creator import instrument
+from text_img_creator.lru import LruCache
+
+# The linear walk loads every size up to the one it settles on, so the cap
+# must exceed the largest size probed or repeated walks evict each other.
+# Faces map the font file, each costing about 20 KiB besides the shared pages.
+default_font_cache_size = 1024
+
+FontCacheInfo = namedtuple(
+    "FontCacheInfo",
+    ["hits", "misses", "maxsize", "currsize"]
+)
+
+
+class FontCache:
+    """Keep recently used fonts, evicting the least recently used."""
+
+    def __init__(self, maxsize=default_font_cache_size):
+        """Initialize empty cache holding at most maxsize fonts."""
+        self._fonts = LruCache(maxsize)
+
+    @property
+    def maxsize(self):
+        """Get size cap."""
+        return self._fonts.max_size
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        """Set size cap, evicting fonts beyond it."""
+        self._fonts.max_size = maxsize
+
+    def get(self, font_name, size, index=0):
+        """Get font_name at size, loading it on a miss."""
+        key = (font_name, size, index)
+        font = self._fonts.get(key)
+        if font is not None:
+            instrument.count("font_cache_hits")
+            return font
+
+        font = ImageFont.truetype(font_name, size, index=index)
+        instrument.count("font_cache_misses")
+        return self._fonts.put(key, font)
+
+    def info(self):
+        """Get hit and miss counts, size cap and current size."""
+        hits, misses, currsize, _ = self._fonts.counts()
+        return FontCacheInfo(hits, misses, self._fonts.max_size, currsize)
+
+    def clear(self):
+        """Drop all fonts and reset counters."""
+        self._fonts.clear()
+
+
+font_cache = FontCache()
+
+
+def get_font(font_name, size, index=0):
+    """Get font from the process wide cache."""
+    return font_cache.get(font_name, size, index)
+
+
+def font_cache_info():
+    """Get statistics of the process wide cache."""
+    return font_cache.info()
+
+
+def set_font_cache_size(maxsize):
+    """Set size cap of the process wide cache (None for unbounded)."""
+    font_cache.maxsize = maxsize
+
+
+def clear_font_cache():
+    """Empty the process wide cache."""
+    font_cache.clear()
+
+
+_font_digests = {}
+_font_digests_lock = Lock()
+
+
+def font_digest(font_name):
+    """Get sha256 hex digest of a font file's contents.
+
+    Digests are remembered per path, size and modification time. Names
+    which are not files (left for FreeType to resolve) are returned as is.
+    """
+    try:
+        st = os.stat(font_name)
+    except (OSError, TypeError, ValueError):
+        return str(font_name)
+
+    key = (font_name, st.st_size, st.st_mtime_ns)
+    with _font_digests_lock:
+        try:
+            return _font_digests[key]
+        except KeyError:
+            pass
+
+    h = hashlib.sha256()
+    with open(font_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _font_digests_lock:
+        _font_digests[key] = digest
+    return digest
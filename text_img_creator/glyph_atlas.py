@@ -0,0 +1,277 @@
+"""Draw text from cached glyph masks instead of rendering it each time."""
+from collections import namedtuple
+from math import floor, modf
+from threading import Lock
+from weakref import WeakKeyDictionary
+from PIL import Image, ImageColor, ImageDraw, ImageFont, __version__
+from text_img_creator import instrument
+from text_img_creator.font_cache import font_digest
+from text_img_creator.lru import LruCache, entry_overhead
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    basic_layout = ImageFont.Layout.BASIC
+except AttributeError:
+    basic_layout = ImageFont.LAYOUT_BASIC
+
+pillow_version = tuple(int(v) for v in __version__.split(".")[:2])
+# Pillow 10.2 blends overlapping glyphs, earlier versions keep the maximum
+blend_overlaps = pillow_version >= (10, 2)
+# Pillow 11 rounds the start of a line to 1/64 pixel, earlier ones truncate
+round_start = pillow_version >= (11, 0)
+
+default_atlas_bytes = 32 * 1024 * 1024
+
+AtlasInfo = namedtuple(
+    "AtlasInfo",
+    ["hits", "misses", "glyphs", "pairs", "bytes", "max_bytes"]
+)
+
+
+def pixel(x):
+    """Round 26.6 fixed point x to whole pixels like FreeType does."""
+    return (x + 32) >> 6
+
+
+def pen_start(origin, start):
+    """Get the 26.6 pen position Pillow starts a line at.
+
+    Pillow computes (origin + start) * 64 in single precision, origin being
+    a whole number of pixels and start the fractional part of the position.
+    """
+    v = float((numpy.float32(origin) + numpy.float32(start)) * 64)
+    if not round_start:
+        return int(v)
+    if v < 0:
+        return -floor(0.5 - v)
+    return floor(v + 0.5)
+
+
+def entry_bytes(entry):
+    """Size a cached glyph (mask, x, y) or pen advance."""
+    if isinstance(entry, int):
+        return entry_overhead
+    return entry[0].nbytes + entry_overhead
+
+
+def merge_masks(line, mask):
+    """Merge glyph mask into region line of a line's mask in place."""
+    if blend_overlaps:
+        tmp = line.astype(numpy.uint16) * (255 - mask) + 128
+        line[:] = mask + (((tmp >> 8) + tmp) >> 8)
+    else:
+        numpy.maximum(line, mask, out=line)
+
+
+class GlyphAtlas:
+    """Keep coverage masks of glyphs keyed by (font, size, glyph).
+
+    A line of text is put together like Pillow's basic layout does it: the
+    pen advances in 1/64 pixels (kerning included), starting at the
+    fractional part of the position, and each glyph's mask is placed at the
+    pen rounded to whole pixels. Overlapping masks are merged like the
+    installed Pillow merges them and the ink is blended in by the same call
+    ImageDraw.text ends with, so masks are shared by all colors and the
+    result matches ImageDraw.text pixel for pixel.
+
+    Fonts using raqm layout (ligatures, shaping), images not in RGB or RGBA
+    mode, multiline text and positions with a negative fractional part
+    (where Pillow clips glyphs to its mask) are drawn with ImageDraw.text.
+
+    The least recently used masks and kerning pairs are dropped once they
+    take up more than max_bytes.
+    """
+
+    def __init__(self, max_bytes=default_atlas_bytes):
+        """Initialize empty atlas."""
+        if numpy is None:
+            raise ImportError("the glyph atlas requires numpy")
+        self._entries = LruCache(max_bytes, entry_bytes)
+        self._font_keys = WeakKeyDictionary()
+        self._lock = Lock()
+
+    @property
+    def max_bytes(self):
+        """Get byte cap."""
+        return self._entries.max_size
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        """Set byte cap, evicting masks and pairs beyond it."""
+        self._entries.max_size = max_bytes
+
+    def font_key(self, font):
+        """Identify a FreeTypeFont by file digest, size and face index."""
+        with self._lock:
+            key = self._font_keys.get(font)
+        if key is not None:
+            return key
+        key = (font_digest(font.path), font.size, font.index)
+        with self._lock:
+            self._font_keys[font] = key
+        return key
+
+    def glyph(self, font, font_key, c):
+        """Get (mask, x offset, y offset) of glyph c, rendering on a miss."""
+        key = font_key + (c,)
+        entry = self._entries.get(key)
+        if entry is not None:
+            instrument.count("glyph_atlas_hits")
+            return entry
+
+        left, top, right, bottom = font.getbbox(c)
+        if right <= left or bottom <= top:
+            mask = numpy.zeros((0, 0), dtype=numpy.uint8)
+        else:
+            im = Image.new("L", (right - left, bottom - top), 0)
+            ImageDraw.Draw(im).text((-left, -top), c, font=font, fill=255)
+            mask = numpy.asarray(im)
+        instrument.count("glyph_atlas_misses")
+        return self._entries.put(key, (mask, left, top))
+
+    def advance(self, font, font_key, a, b):
+        """Get pen advance in 1/64 pixels from glyph a to b, with kerning."""
+        key = font_key + (a, b)
+        advance = self._entries.get(key)
+        if advance is not None:
+            return advance
+
+        advance = round((font.getlength(a + b) - font.getlength(b)) * 64)
+        return self._entries.put(key, advance)
+
+    def placed_glyphs(self, font, text, start=(0, 0), render=True):
+        """Get (mask, glyph, x, y, width, height) of inked glyphs of text.
+
+        start is the fractional part of the position the text is drawn at,
+        the positions are relative to its whole part. Without render
+        glyphs are only measured and mask is None.
+        """
+        font_key = self.font_key(font)
+        glyphs = []
+        pen = 0
+        prev = None
+        for c in text:
+            if prev is not None:
+                pen += self.advance(font, font_key, prev, c)
+            prev = c
+            if render:
+                mask, gx, gy = self.glyph(font, font_key, c)
+                h, w = mask.shape
+            else:
+                mask = None
+                gx, gy, right, bottom = font.getbbox(c)
+                w, h = max(right - gx, 0), max(bottom - gy, 0)
+            glyphs.append((mask, c, w, h, pen, gx, gy))
+
+        # Pillow starts the pen relative to the top left of the line's ink
+        x_min = min([0] + [gx + pixel(pen) for *_, pen, gx, _ in glyphs])
+        ascent = font.getmetrics()[0]
+        y_max = max(
+            [0] + [ascent - gy for _, _, w, h, _, _, gy in glyphs if w and h]
+        )
+        x = pen_start(-x_min, start[0])
+        dy = -y_max - pixel(pen_start(-y_max, -start[1]))
+        return [
+            (mask, c, x_min + pixel(x + pen) + gx, gy + dy, w, h)
+            for mask, c, w, h, pen, gx, gy in glyphs
+            if w and h
+        ]
+
+    def line_mask(self, font, text, start=(0, 0), box=None, clip=False):
+        """Get (mask, x offset, y offset) of text drawn at start.
+
+        start is the fractional part of the position the text is drawn at,
+        the offsets are relative to its whole part. With box (left, top,
+        right, bottom) only the part of the line inside of it is put
+        together; with clip glyphs are rendered one at a time as they are
+        merged, and only if they reach into box. None if nothing is inked.
+        """
+        placed = self.placed_glyphs(font, text, start, not clip)
+        if not placed:
+            return None
+
+        left = min(x for _, _, x, _, _, _ in placed)
+        top = min(y for _, _, _, y, _, _ in placed)
+        right = max(x + w for _, _, x, _, w, _ in placed)
+        bottom = max(y + h for _, _, _, y, _, h in placed)
+        if box is not None:
+            left, top = max(left, box[0]), max(top, box[1])
+            right, bottom = min(right, box[2]), min(bottom, box[3])
+            if left >= right or top >= bottom:
+                return None
+        line = numpy.zeros((bottom - top, right - left), dtype=numpy.uint8)
+        font_key = self.font_key(font)
+        for mask, c, x, y, w, h in placed:
+            x0, y0 = max(x, left), max(y, top)
+            x1, y1 = min(x + w, right), min(y + h, bottom)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            if mask is None:
+                mask = self.glyph(font, font_key, c)[0]
+            merge_masks(
+                line[y0 - top:y1 - top, x0 - left:x1 - left],
+                mask[y0 - y:y1 - y, x0 - x:x1 - x]
+            )
+            # Do not hold on to a mask the atlas dropped while rendering
+            # the next one
+            del mask
+        return line, left, top
+
+    def draw(self, im, xy, text, font, fill, clip=False):
+        """Draw text onto im like ImageDraw.Draw(im).text(xy, ...).
+
+        Only the part of the line inside im is put together. With clip
+        glyphs outside of im are not rendered either, at the cost of
+        measuring every glyph on each call, which pays off when drawing a
+        line across strips of an image.
+        """
+        start = (modf(xy[0])[0], modf(xy[1])[0])
+        draw = ImageDraw.Draw(im)
+        if (
+            im.mode not in ("RGB", "RGBA") or
+            getattr(font, "layout_engine", basic_layout) != basic_layout or
+            "\n" in text or
+            min(start) < 0
+        ):
+            draw.text(xy, text, font=font, fill=fill)
+            return
+
+        x, y = int(xy[0]), int(xy[1])
+        box = (-x, -y, im.width - x, im.height - y)
+        line = self.line_mask(font, text, start, box, clip)
+        if line is None:
+            return
+        mask, left, top = line
+        if isinstance(fill, str):
+            fill = ImageColor.getcolor(fill, im.mode)
+        # Blend like ImageDraw.text does once it has the line's mask
+        draw.draw.draw_bitmap(
+            (x + left, y + top),
+            Image.fromarray(mask).im,
+            draw.draw.draw_ink(fill)
+        )
+
+    def info(self):
+        """Get lookup counts and the footprint of the atlas.
+
+        Hits and misses count lookups of glyphs and kerning pairs alike.
+        """
+        entries = self._entries.items()
+        pairs = sum(isinstance(entry, int) for _, entry in entries)
+        hits, misses, _, size = self._entries.counts()
+        return AtlasInfo(
+            hits,
+            misses,
+            len(entries) - pairs,
+            pairs,
+            size,
+            self.max_bytes
+        )
+
+    def clear(self):
+        """Drop all masks and pairs and reset counters."""
+        self._entries.clear()
@@ -2,7 +2,19 @@
 from collections.abc import MutableMapping
 import sys
 import os
+import struct
 import subprocess
+import zlib
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait
+)
+from text_img_creator import instrument
+
+png_signature = b"\x89PNG\r\n\x1a\n"
+
 
 class InvalidPadding(Exception):
     """Raised on padding of length 3, or >4."""
@@ -45,6 +57,7 @@ class ImageText:
         self.sy = sy
         self.width = target_width
         self.height = target_height
+        self.probes = None
 
     def __str__(self):
         """Return text prop."""
@@ -66,6 +79,7 @@ class ImageProps(MutableMapping):
     width_key = "width"
     height_key = "height"
     back_col_key = "background_color"
+    img_key = "image"
 
     def __init__(self, fname, ext, width, height, **kwargs):
         """Set initial properties."""
@@ -83,7 +97,7 @@ class ImageProps(MutableMapping):
 
     def __delitem__(self, key):
         """Del key."""
-        del self.storage[key]
+        del self._storage[key]
 
     def __setitem__(self, key, item):
         """Set key to item."""
@@ -102,7 +116,50 @@ class ImageProps(MutableMapping):
         return str(self._storage)
 
 
-def run_command_on_imgs(create_command, apply_command_to_img=lambda x, y: True, source_dir_path=None, types=None):
+def png_chunk(kind, data):
+    """Create PNG chunk."""
+    return (
+        struct.pack(">I", len(data)) +
+        kind +
+        data +
+        struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    )
+
+
+def png_chunks(data):
+    """Yield (kind, data) of the chunks of an encoded PNG."""
+    pos = len(png_signature)
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        kind = data[pos + 4:pos + 8]
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += length + 12
+
+
+def list_dir(source_dir_path):
+    """Lazily yield paths of the entries of source_dir_path."""
+    with os.scandir(source_dir_path) as entries:
+        for entry in entries:
+            yield entry.path
+
+
+def iter_command_on_imgs(
+    create_command,
+    apply_command_to_img=lambda x, y: True,
+    source_dir_path=None,
+    types=None,
+    workers=1,
+    failures=None
+):
+    """Run commands on images, yielding output files as they complete.
+
+    Images are the command line arguments if there are any, else the
+    entries of source_dir_path, listed lazily. Up to workers commands run
+    at once. Given a failures list, commands exiting with a non-zero status
+    are appended to it (as CompletedProcess) instead of yielding their
+    output file; without one every output file is yielded, as the commands
+    used to be run without checking their status.
+    """
     if types is None:
         types = [".png"]
 
@@ -110,13 +167,58 @@ def run_command_on_imgs(create_command, apply_command_to_img=lambda x, y: True,
     if len(sys.argv) > 1:
         fname_iter = sys.argv
     else:
-        fname_iter = [os.path.join(source_dir_path, fname_and_extension) for fname_and_extension in os.listdir(source_dir_path)]
-
-    output = []
-    for fname_and_extension in fname_iter:
-        fname, fext = os.path.splitext(fname_and_extension)
-        if apply_command_to_img(fname, fext) and fext in types:
-            output_file, command = create_command(fname, fext)
-            subprocess.run(command)
-            output.append(output_file)
-    return output
+        fname_iter = list_dir(source_dir_path)
+
+    def run(output_file, command):
+        instrument.count("subprocesses")
+        return output_file, subprocess.run(command)
+
+    def commands():
+        for fname_and_extension in fname_iter:
+            fname, fext = os.path.splitext(fname_and_extension)
+            if apply_command_to_img(fname, fext) and fext in types:
+                yield create_command(fname, fext)
+
+    def finished(future):
+        output_file, completed = future.result()
+        if completed.returncode and failures is not None:
+            failures.append(completed)
+            return False
+        return True
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = set()
+        for output_file, command in commands():
+            pending.add(pool.submit(run, output_file, command))
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if finished(future):
+                        yield future.result()[0]
+
+        for future in as_completed(pending):
+            if finished(future):
+                yield future.result()[0]
+
+
+def run_command_on_imgs(
+    create_command,
+    apply_command_to_img=lambda x, y: True,
+    source_dir_path=None,
+    types=None,
+    workers=1,
+    failures=None
+):
+    """Run commands on images, returning list of output files.
+
+    See iter_command_on_imgs; with several workers the list is in
+    completion order.
+    """
+    return list(iter_command_on_imgs(
+        create_command,
+        apply_command_to_img,
+        source_dir_path,
+        types,
+        workers,
+        failures
+    ))
@@ -0,0 +1,208 @@
+"""Opt-in timing of rendering stages and counting of expensive work.
+
+Nothing is measured until a sink is added. A sink is any callable taking
+(kind, name, value): kind "stage" reports a stage's duration in seconds,
+kind "count" an increment of a counter. JsonLinesSink logs events and
+AggregateSink sums them up in process.
+
+Stages are determine_min_image_size, make_lean_image, svg_convert,
+concat_images, rotate_img and record_image_properties as a whole, and
+within them draw, encode, trace and concat. Counters are font_probes,
+font_cache_hits/misses, measure_index_hits/misses,
+glyph_cache_hits/misses, glyph_atlas_hits/misses, output_cache_hits/misses,
+subprocesses and bytes_written.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+stage_kind = "stage"
+count_kind = "count"
+
+_sinks = ()
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """Start reporting events to sink."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+
+
+def remove_sink(sink):
+    """Stop reporting events to sink."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+@contextmanager
+def instrumented(*sinks):
+    """Report events to sinks while in context."""
+    for sink in sinks:
+        add_sink(sink)
+    try:
+        yield sinks
+    finally:
+        for sink in sinks:
+            remove_sink(sink)
+
+
+def enabled():
+    """Check whether any sink is listening."""
+    return bool(_sinks)
+
+
+def emit(kind, name, value):
+    """Pass event to all sinks."""
+    for sink in _sinks:
+        sink(kind, name, value)
+
+
+def count(name, n=1):
+    """Add n to counter name."""
+    if _sinks:
+        emit(count_kind, name, n)
+
+
+def count_file_size(path, name="bytes_written"):
+    """Add size of the file at path to counter name."""
+    if _sinks:
+        emit(count_kind, name, os.path.getsize(path))
+
+
+class Stage:
+    """Time a block and report it as stage name."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        """Initialize stage."""
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        """Start clock."""
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        """Report elapsed time."""
+        emit(stage_kind, self.name, time.perf_counter() - self.start)
+
+
+class NullStage:
+    """Stand in for Stage while nothing listens."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        """Do nothing."""
+        return self
+
+    def __exit__(self, *exc):
+        """Do nothing."""
+
+
+null_stage = NullStage()
+
+
+def stage(name):
+    """Get context manager timing stage name."""
+    if _sinks:
+        return Stage(name)
+    return null_stage
+
+
+def timed(name):
+    """Decorate function to be timed as stage name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class JsonLinesSink:
+    """Append events to a file, one JSON object per line."""
+
+    def __init__(self, dest):
+        """Initialize sink writing to path or text file object dest."""
+        self._own = isinstance(dest, str)
+        self._fp = open(dest, "a") if self._own else dest
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, name, value):
+        """Write event."""
+        line = json.dumps({
+            "time": time.time(),
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "kind": kind,
+            "name": name,
+            "value": value,
+        }) + "\n"
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+
+    def close(self):
+        """Close file if opened by the sink."""
+        if self._own:
+            self._fp.close()
+
+
+class AggregateSink:
+    """Sum up stage times and counters in process."""
+
+    def __init__(self):
+        """Initialize empty aggregate."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __call__(self, kind, name, value):
+        """Add event."""
+        with self._lock:
+            if kind == count_kind:
+                self.counters[name] = self.counters.get(name, 0) + value
+                return
+            try:
+                calls, total, low, high = self.stages[name]
+            except KeyError:
+                self.stages[name] = [1, value, value, value]
+            else:
+                self.stages[name] = [
+                    calls + 1,
+                    total + value,
+                    min(low, value),
+                    max(high, value)
+                ]
+
+    def reset(self):
+        """Drop collected values."""
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+    def summary(self):
+        """Get stage statistics (seconds) and counter totals."""
+        with self._lock:
+            stages = {
+                name: {
+                    "calls": calls,
+                    "total": total,
+                    "mean": total / calls,
+                    "min": low,
+                    "max": high,
+                }
+                for name, (calls, total, low, high) in self.stages.items()
+            }
+            return {"stages": stages, "counters": dict(self.counters)}
@@ -0,0 +1,122 @@
+"""Wrap paragraphs into lines fitting a box, measuring words, not pixels."""
+from bisect import bisect_right
+from itertools import accumulate
+from math import floor, sqrt
+from text_img_creator import (
+    calibration_probe_size,
+    get_font,
+    instrument,
+    search_font_size,
+)
+from text_img_creator.img_utils import ImageText
+
+
+def word_advances(font, words):
+    """Get advance width of each word and of a space in font."""
+    return [font.getlength(w) for w in words], font.getlength(" ")
+
+
+def break_lines(widths, space, max_width):
+    """Break words greedily into lines no wider than max_width.
+
+    With P[k] the advance of the first k words plus k spaces, words i to
+    j - 1 span P[j] - P[i] - space, so the end of each line is a bisection
+    of P. Returns the (start, end) word indices of each line, or None if a
+    single word is wider than max_width.
+    """
+    prefix = list(accumulate((w + space for w in widths), initial=0))
+    lines = []
+    start = 0
+    while start < len(widths):
+        end = bisect_right(prefix, prefix[start] + max_width + space) - 1
+        if end <= start:
+            return None
+        lines.append((start, end))
+        start = end
+    return lines
+
+
+def line_height(font):
+    """Get line height (ascent plus descent) of font."""
+    ascent, descent = font.getmetrics()
+    return ascent + descent
+
+
+class Paragraphs:
+    """Words of a text, split into paragraphs at newlines."""
+
+    def __init__(self, text):
+        """Split text, dropping empty paragraphs."""
+        self.paragraphs = [
+            p.split() for p in text.split("\n") if p.strip()
+        ]
+
+    def wrap(self, font, max_width):
+        """Get lines of the text wrapped at max_width, or None."""
+        lines = []
+        for words in self.paragraphs:
+            widths, space = word_advances(font, words)
+            breaks = break_lines(widths, space, max_width)
+            if breaks is None:
+                return None
+            lines.extend(" ".join(words[i:j]) for i, j in breaks)
+        return lines
+
+
+def fit_text(
+    text,
+    width,
+    height,
+    font_name,
+    line_spacing=0,
+    max_size=None,
+    color=None
+):
+    """Find largest font size at which text wraps into width x height.
+
+    Words are measured with font metrics once per tried size and a block
+    of n lines is taken to be n line heights plus n - 1 line_spacing high,
+    so the work grows with the number of words, not with the image.
+    Returns (font_size, lines), lines being ImageText objects to render
+    with make_lean_image at font_size, with a text_seperation of
+    line_spacing. Raises ValueError for text without words, which would
+    fit at any size.
+    """
+    paragraphs = Paragraphs(text)
+    if not paragraphs.paragraphs:
+        raise ValueError(repr(text) + " has no words to fit")
+    wrapped = {}
+
+    def fits(size):
+        if size not in wrapped:
+            font = get_font(font_name, size)
+            lines = paragraphs.wrap(font, width)
+            if lines is not None:
+                block = (
+                    len(lines) * line_height(font) +
+                    (len(lines) - 1) * line_spacing
+                )
+                if block > height:
+                    lines = None
+            wrapped[size] = lines
+            instrument.count("font_probes")
+        return wrapped[size] is not None
+
+    # Guess from the area the text takes up at the probe size
+    probe_font = get_font(font_name, calibration_probe_size)
+    advance = sum(
+        sum(widths) + space * len(widths)
+        for widths, space in (
+            word_advances(probe_font, words)
+            for words in paragraphs.paragraphs
+        )
+    )
+    area = advance * line_height(probe_font)
+    guess = calibration_probe_size
+    if area > 0:
+        guess = floor(calibration_probe_size * sqrt(width * height / area))
+
+    size = search_font_size(fits, guess, 1, max_size)
+    if size < 1:
+        raise ValueError(repr(text) + " does not fit into the box")
+    return size, [ImageText(line, color=color) for line in wrapped[size]]
@@ -0,0 +1,95 @@
+"""Thread safe least recently used caches with a size cap."""
+from collections import OrderedDict
+from threading import Lock
+
+# Bookkeeping bytes charged per entry by caches capped in bytes
+entry_overhead = 100
+
+
+def count_entries(value):
+    """Size every entry as one, capping the number of entries."""
+    return 1
+
+
+class LruCache:
+    """Map keys to values, dropping the least recently used ones.
+
+    Entries are sized by sizeof; once their total exceeds max_size (None
+    for unbounded) the least recently used entries are dropped.
+    """
+
+    def __init__(self, max_size, sizeof=count_entries):
+        """Initialize empty cache."""
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        """Get size cap."""
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size):
+        """Set size cap, evicting entries beyond it."""
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries beyond the size cap."""
+        if self._max_size is None:
+            return
+        while self._entries and self.size > self._max_size:
+            _, old = self._entries.popitem(last=False)
+            self.size -= self.sizeof(old)
+
+    def get(self, key):
+        """Get value of key, marking it recently used, or None on a miss."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Add value under key unless present, getting the stored value."""
+        with self._lock:
+            try:
+                return self._entries[key]
+            except KeyError:
+                pass
+            self._entries[key] = value
+            self.size += self.sizeof(value)
+            self._evict()
+            return value
+
+    def items(self):
+        """Get list of (key, value) from least to most recently used."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def counts(self):
+        """Get (hits, misses, number of entries, size) at once."""
+        with self._lock:
+            return self.hits, self.misses, len(self._entries), self.size
+
+    def __len__(self):
+        """Get number of entries."""
+        return len(self._entries)
+
+    def clear(self):
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,169 @@
+"""Persistent index of text measurements shared between processes."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from text_img_creator.font_cache import font_digest
+
+default_index_size = 64 * 1024 * 1024
+default_timeout = 30
+touch_interval = 60
+
+
+class MeasureIndex:
+    """Store measurements made by determine_min_image_size in SQLite.
+
+    Entries are keyed by text, font file digest, size mode, calibration,
+    measure, targets and padding. The database runs in WAL mode so several
+    worker processes can read and write it at once; each process and thread
+    opens its own connection. Once the live data grows past max_bytes the
+    least recently used tenth of the entries is dropped.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=default_index_size,
+        timeout=default_timeout
+    ):
+        """Initialize index stored at path."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def __getstate__(self):
+        """Pickle settings only, connections are opened per process."""
+        state = dict(self.__dict__)
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        """Restore settings."""
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connect(self):
+        """Get connection of the calling process and thread."""
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS measurements ("
+                "key TEXT PRIMARY KEY, "
+                "width INTEGER, height INTEGER, sx INTEGER, sy INTEGER, "
+                "font_size INTEGER, used REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS measurements_used "
+                "ON measurements (used)"
+            )
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    @staticmethod
+    def make_key(
+        text,
+        font_name,
+        size_mode,
+        calibration,
+        measure,
+        target_width,
+        target_height,
+        padding
+    ):
+        """Create index key of a measurement."""
+        return json.dumps([
+            str(text),
+            font_digest(font_name),
+            str(size_mode),
+            str(calibration),
+            str(measure),
+            target_width,
+            target_height,
+            list(padding)
+        ])
+
+    def get(self, *key_args):
+        """Get (width, height, sx, sy, font_size) or None on a miss."""
+        key = self.make_key(*key_args)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT width, height, sx, sy, font_size, used "
+            "FROM measurements WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        now = time.time()
+        # Only refresh recency now and then to keep hits read-only
+        if now - row[5] > touch_interval:
+            with conn:
+                conn.execute(
+                    "UPDATE measurements SET used = ? WHERE key = ?",
+                    (now, key)
+                )
+        return row[:5]
+
+    def put(self, *key_args, width, height, sx, sy, font_size):
+        """Store a measurement."""
+        key = self.make_key(*key_args)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO measurements "
+                "(key, width, height, sx, sy, font_size, used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, width, height, sx, sy, font_size, time.time())
+            )
+        if self.max_bytes is not None and self.size() > self.max_bytes:
+            self.evict()
+
+    def size(self):
+        """Get bytes used by live pages of the database."""
+        conn = self._connect()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - free_count) * page_size
+
+    def evict(self, fraction=0.1):
+        """Drop the least recently used fraction of entries."""
+        conn = self._connect()
+        with conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM measurements"
+            ).fetchone()[0]
+            conn.execute(
+                "DELETE FROM measurements WHERE key IN ("
+                "SELECT key FROM measurements ORDER BY used LIMIT ?)",
+                (max(1, int(count * fraction)),)
+            )
+
+    def clear(self):
+        """Drop all entries."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM measurements")
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Close connection of the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
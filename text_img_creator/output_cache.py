@@ -0,0 +1,262 @@
+"""Content addressed cache of rendered images shared between processes."""
+import hashlib
+import json
+import os
+import shutil
+import time
+from functools import partial
+from types import BuiltinFunctionType, CodeType, FunctionType, MethodType
+from uuid import uuid4
+from text_img_creator import instrument
+from text_img_creator.font_cache import font_digest
+from text_img_creator.img_utils import ImageProps
+
+default_output_cache_size = 256 * 1024 * 1024
+touch_interval = 60
+meta_ext = ".json"
+fname_key = ImageProps.fname_key
+ext_key = ImageProps.ext_key
+output_cache_version = 2
+plain_types = (type(None), bool, int, float, complex, str, bytes)
+
+
+def value_digest(value, active=frozenset()):
+    """Digest value the same way in every process.
+
+    Plain values and containers of them are covered by content, functions
+    by name, code, constants, defaults and the contents of their closure
+    cells, partials and bound methods by what they wrap. Raises TypeError
+    for values only identified by their memory address.
+    """
+    parts = [type(value).__module__, type(value).__qualname__]
+    if isinstance(value, plain_types):
+        parts.append(repr(value))
+    elif isinstance(value, (tuple, list)):
+        parts += [value_digest(v, active) for v in value]
+    elif isinstance(value, (set, frozenset)):
+        parts += sorted(value_digest(v, active) for v in value)
+    elif isinstance(value, dict):
+        parts += sorted(
+            value_digest(k, active) + value_digest(v, active)
+            for k, v in value.items()
+        )
+    elif isinstance(value, partial):
+        parts += [
+            value_digest(value.func, active),
+            value_digest(value.args, active),
+            value_digest(value.keywords, active),
+        ]
+    elif isinstance(value, MethodType):
+        parts += [
+            value_digest(value.__func__, active),
+            value_digest(value.__self__, active),
+        ]
+    elif isinstance(value, CodeType):
+        parts += [
+            value.co_name,
+            value.co_code.hex(),
+            value_digest(value.co_consts, active),
+            value_digest(value.co_names, active),
+        ]
+    elif isinstance(value, FunctionType):
+        parts += [value.__module__ or "", value.__qualname__]
+        # A function reached again through its own closure is named only
+        if id(value) not in active:
+            active = active | {id(value)}
+            cells = []
+            for cell in value.__closure__ or ():
+                try:
+                    cells.append(cell.cell_contents)
+                except ValueError:
+                    cells.append(None)
+            parts += [
+                value_digest(value.__code__, active),
+                value_digest(value.__defaults__, active),
+                value_digest(value.__kwdefaults__, active),
+                value_digest(cells, active),
+            ]
+    elif isinstance(value, (BuiltinFunctionType, type)):
+        parts += [value.__module__ or "", value.__qualname__]
+    elif type(value).__repr__ is not object.__repr__:
+        parts.append(repr(value))
+    else:
+        raise TypeError("no deterministic digest of " + repr(value))
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def temp_path(path):
+    """Get a temporary name next to path, unique to the calling thread."""
+    return path + ".tmp" + uuid4().hex
+
+
+def restore_tuples(value):
+    """Turn lists read back from JSON into tuples."""
+    if isinstance(value, list):
+        return tuple(restore_tuples(v) for v in value)
+    return value
+
+
+class OutputCache:
+    """Store rendered images under a digest of everything shaping them.
+
+    Every entry is an artifact file plus a JSON file of its properties,
+    both written to temporary names and renamed into place, the properties
+    last, so concurrent writers and readers on a local disk only ever see
+    complete entries. Once the artifacts grow past max_bytes the least
+    recently used entries are removed until a tenth of the budget is free.
+
+    With hardlink hits link the artifact instead of copying it. Linked
+    outputs share their data with the cache, so they must not be rewritten
+    in place (as rotate_img and a later miss of the same fname would do).
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=default_output_cache_size,
+        hardlink=False
+    ):
+        """Initialize cache stored in directory path."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hardlink = hardlink
+        self.hits = 0
+        self.misses = 0
+        self._bytes = None
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def make_key(**inputs):
+        """Create digest of render inputs.
+
+        font_name is replaced by the font file's digest and other values
+        JSON can not store, such as text_seperation, by their
+        value_digest. Returns None if one of them has no deterministic
+        digest, so the render can not be cached.
+        """
+        inputs = dict(inputs)
+        inputs["version"] = output_cache_version
+        try:
+            inputs["font_name"] = font_digest(inputs["font_name"])
+        except KeyError:
+            pass
+        try:
+            data = json.dumps(inputs, sort_keys=True, default=value_digest)
+        except TypeError:
+            return None
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _entry(self, key):
+        """Get path of key's entry without extension."""
+        return os.path.join(self.path, key[:2], key)
+
+    def _place(self, src, dest):
+        """Link or copy src to dest, replacing dest atomically."""
+        tmp_dest = temp_path(dest)
+        try:
+            if not self.hardlink:
+                raise OSError
+            os.link(src, tmp_dest)
+        except OSError:
+            shutil.copyfile(src, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+    def get(self, key, fname):
+        """Put cached artifact of key at fname + ext.
+
+        Returns the stored properties (with fname) or None on a miss.
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry + meta_ext) as f:
+                props = json.load(f)
+            self._place(entry + props[ext_key], fname + props[ext_key])
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            instrument.count("output_cache_misses")
+            return None
+
+        self.hits += 1
+        instrument.count("output_cache_hits")
+        # Only refresh recency now and then to keep hits cheap
+        try:
+            used = os.stat(entry + meta_ext).st_mtime
+            if time.time() - used > touch_interval:
+                os.utime(entry + meta_ext)
+        except FileNotFoundError:
+            pass
+        props = {k: restore_tuples(v) for k, v in props.items()}
+        props[fname_key] = fname
+        return props
+
+    def put(self, key, artifact, props):
+        """Store file artifact with properties props under key."""
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        ext = props[ext_key]
+        tmp = temp_path(entry)
+        shutil.copyfile(artifact, tmp)
+        os.replace(tmp, entry + ext)
+        with open(tmp, "w") as f:
+            json.dump(dict(props), f)
+        os.replace(tmp, entry + meta_ext)
+
+        if self.max_bytes is None:
+            return
+        if self._bytes is None:
+            self._bytes = self.size()
+        else:
+            self._bytes += os.path.getsize(entry + ext)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """Yield (used, size, meta path, artifact path) of all entries."""
+        for sub in os.scandir(self.path):
+            if not sub.is_dir():
+                continue
+            for meta in os.scandir(sub.path):
+                if not meta.name.endswith(meta_ext):
+                    continue
+                try:
+                    with open(meta.path) as f:
+                        ext = json.load(f)[ext_key]
+                    artifact = meta.path[:-len(meta_ext)] + ext
+                    used = meta.stat().st_mtime
+                    size = os.path.getsize(artifact)
+                except (FileNotFoundError, ValueError):
+                    continue
+                yield used, size, meta.path, artifact
+
+    def size(self):
+        """Get bytes used by cached artifacts."""
+        return sum(size for _, size, _, _ in self._entries())
+
+    def evict(self, fraction=0.1):
+        """Drop least recently used entries until fraction is free."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _, _ in entries)
+        limit = self.max_bytes * (1 - fraction)
+        for _, size, meta, artifact in entries:
+            if total <= limit:
+                break
+            # Properties go first, so readers see a miss, not half an entry
+            for path in (meta, artifact):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        self._bytes = total
+
+    def clear(self):
+        """Drop all entries."""
+        for _, _, meta, artifact in list(self._entries()):
+            for path in (meta, artifact):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
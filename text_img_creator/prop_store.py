@@ -0,0 +1,188 @@
+"""Buffered, lockable store of image properties exported for the shell."""
+import atexit
+import os
+import threading
+import time
+from multiprocessing.util import Finalize
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+default_flush_interval = 0
+
+
+def format_export(var, val):
+    """Create export line of a variable."""
+    return " ".join(["export", var + "=" + '"' + val + '"']) + "\n"
+
+
+def export_var(line):
+    """Get variable name of an export line (None for other lines)."""
+    if not line.startswith("export"):
+        return None
+    split_line = line.split()
+    if len(split_line) < 2:
+        return None
+    return split_line[1].split("=")[0]
+
+
+class PropertyStore:
+    """Keep an export file's lines indexed by variable, buffering updates.
+
+    Updates are written when flush_interval seconds have passed since the
+    last write (0 writes on every update, None only on flush and at exit),
+    by a timer thread if no later update comes, so long-lived processes
+    do not hold values back.
+    multiprocessing workers leave through os._exit, skipping atexit, so
+    pools using another interval must run flush_at_worker_exit in their
+    initializer.
+    Writes hold an exclusive lock on path + ".lock", merge with changes
+    other processes made since the file was last read and replace the
+    file atomically.
+    """
+
+    def __init__(self, path, flush_interval=default_flush_interval):
+        """Initialize store of export file at path."""
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._index = {}
+        self._pending = {}
+        self._stat = None
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def _file_stat(self):
+        """Get identity of the file on disk (None if missing)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _load(self):
+        """Read the file and index its export lines."""
+        try:
+            with open(self.path) as ip:
+                self._lines = ip.readlines()
+        except FileNotFoundError:
+            self._lines = []
+        self._index = {}
+        for i, line in enumerate(self._lines):
+            var = export_var(line)
+            if var is not None and var not in self._index:
+                self._index[var] = i
+        self._stat = self._file_stat()
+
+    def _write(self):
+        """Replace the file with the current lines."""
+        tmp_path = self.path + ".tmp" + str(os.getpid())
+        with open(tmp_path, "w") as ip:
+            ip.writelines(self._lines)
+        try:
+            os.chmod(tmp_path, os.stat(self.path).st_mode)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, self.path)
+        self._stat = self._file_stat()
+
+    def get(self, var):
+        """Get value of var (pending updates included), or None."""
+        with self._lock:
+            try:
+                return self._pending[var]
+            except KeyError:
+                pass
+            if self._stat is None or self._stat != self._file_stat():
+                self._load()
+            try:
+                line = self._lines[self._index[var]]
+            except KeyError:
+                return None
+            return line.split("=", 1)[1].strip().strip('"')
+
+    def update(self, bash_vars):
+        """Buffer variable values, flushing when the interval is up."""
+        with self._lock:
+            self._pending.update(bash_vars)
+            if self.flush_interval is None:
+                return
+            wait = self._last_flush + self.flush_interval - time.monotonic()
+            if wait <= 0:
+                self.flush()
+            elif self._timer is None or not self._timer.is_alive():
+                # Not alive either in a child forked after it started
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write buffered values to the file."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+
+            with open(self.path + ".lock", "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if self._stat is None or self._stat != self._file_stat():
+                    self._load()
+
+                for var, val in self._pending.items():
+                    line = format_export(var, val)
+                    try:
+                        self._lines[self._index[var]] = line
+                    except KeyError:
+                        self._index[var] = len(self._lines)
+                        self._lines.append(line)
+                self._write()
+            self._pending.clear()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_property_store(path):
+    """Get the store of path, creating it on first use."""
+    with _stores_lock:
+        try:
+            return _stores[path]
+        except KeyError:
+            store = _stores[path] = PropertyStore(
+                path,
+                default_flush_interval
+            )
+            return store
+
+
+def set_flush_interval(flush_interval):
+    """Set flush interval of existing and future stores."""
+    global default_flush_interval
+    default_flush_interval = flush_interval
+    with _stores_lock:
+        for store in _stores.values():
+            store.flush_interval = flush_interval
+
+
+def flush_property_stores():
+    """Write buffered values of all stores."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+
+def flush_at_worker_exit():
+    """Flush all stores when the calling worker process exits."""
+    Finalize(None, flush_property_stores, exitpriority=10)
+
+
+atexit.register(flush_property_stores)
@@ -0,0 +1,300 @@
+"""Long lived render server keeping fonts and caches warm.
+
+The server listens on a Unix socket (an address string) or on a TCP port
+of localhost (a (host, port) tuple) and speaks JSON lines. Each request
+is an object with an "id", a "job" (make_lean_image arguments in the
+form load_job reads) and optionally "return": "bytes" to get the encoded
+image base64 encoded under "image" instead of a file written to
+fname + ext. Each response carries the request's "id" and either "props"
+or "error". Requests on one connection may be pipelined, responses are
+sent as jobs finish.
+
+A Unix socket is only accessible to its owner. Jobs may name any fname
+unless the server is given an output root, which confines them to it.
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from text_img_creator import encode_img, img_key, make_lean_image
+from text_img_creator.batch import load_job, parse_fonts, warm_fonts
+from text_img_creator.measure_index import MeasureIndex
+from text_img_creator.output_cache import OutputCache
+from text_img_creator.prop_store import flush_at_worker_exit
+
+return_bytes = "bytes"
+return_path = "path"
+
+_worker_caches = {}
+
+
+def init_worker(fonts=(), output_cache=None, measure_index=None):
+    """Load fonts and open the caches worker jobs share."""
+    warm_fonts(fonts)
+    flush_at_worker_exit()
+    if output_cache is not None:
+        _worker_caches["output_cache"] = OutputCache(output_cache)
+    if measure_index is not None:
+        _worker_caches["measure_index"] = MeasureIndex(measure_index)
+
+
+def serve_job(spec, returns=return_path):
+    """Render job spec, returning JSON ready props (and image bytes)."""
+    job = load_job(spec)
+    for k, cache in _worker_caches.items():
+        job.setdefault(k, cache)
+    if returns == return_bytes:
+        job["in_memory"] = True
+
+    props, = make_lean_image(**job)
+    image = None
+    if returns == return_bytes:
+        image = encode_img(**props)
+        del props[img_key]
+    return dict(props), image
+
+
+def resolve_output(fname, output_root):
+    """Resolve fname against output_root, refusing paths outside of it."""
+    root = os.path.realpath(output_root)
+    path = os.path.realpath(os.path.join(root, fname))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(repr(fname) + " is outside of " + repr(output_root))
+    return path
+
+
+class RenderHandler(socketserver.StreamRequestHandler):
+    """Serve the requests of one connection."""
+
+    def handle(self):
+        """Submit each request line and answer as jobs complete."""
+        write_lock = threading.Lock()
+        pending = []
+
+        def respond(response):
+            line = json.dumps(response).encode() + b"\n"
+            with write_lock:
+                try:
+                    self.wfile.write(line)
+                    self.wfile.flush()
+                except OSError:
+                    pass
+
+        def finished(request_id, future):
+            try:
+                props, image = future.result()
+            except Exception:
+                respond({"id": request_id, "error": traceback.format_exc()})
+                return
+            response = {"id": request_id, "props": props}
+            if image is not None:
+                response["image"] = base64.b64encode(image).decode()
+            respond(response)
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                job = request["job"]
+                if self.server.output_root is not None:
+                    job = dict(job)
+                    job["fname"] = resolve_output(
+                        job["fname"],
+                        self.server.output_root
+                    )
+                future = self.server.pool.submit(
+                    serve_job,
+                    job,
+                    request.get("return", return_path)
+                )
+            except Exception:
+                respond({"id": request_id, "error": traceback.format_exc()})
+                continue
+            future.add_done_callback(
+                lambda f, request_id=request_id: finished(request_id, f)
+            )
+            pending.append(future)
+
+        for future in pending:
+            future.exception()
+
+
+class UnixRenderServer(
+    socketserver.ThreadingMixIn,
+    socketserver.UnixStreamServer
+):
+    """Render server on a Unix socket."""
+
+    daemon_threads = True
+
+
+class TcpRenderServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Render server on a TCP port."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(
+    address,
+    workers=None,
+    fonts=(),
+    output_cache=None,
+    measure_index=None,
+    output_root=None
+):
+    """Create server on address with a pool of worker processes.
+
+    fonts lists (font_name, size) pairs every worker loads up front,
+    output_cache and measure_index are paths of caches the workers use for
+    jobs which do not name their own. With output_root job fnames are
+    resolved against it and jobs writing outside of it are refused.
+    """
+    if isinstance(address, str):
+        try:
+            os.remove(address)
+        except FileNotFoundError:
+            pass
+        server = UnixRenderServer(
+            address,
+            RenderHandler,
+            bind_and_activate=False
+        )
+        try:
+            server.server_bind()
+            # Restrict the socket before it accepts connections
+            os.chmod(address, 0o600)
+            server.server_activate()
+        except BaseException:
+            server.server_close()
+            raise
+    else:
+        server = TcpRenderServer(tuple(address), RenderHandler)
+    server.output_root = output_root
+    server.pool = ProcessPoolExecutor(
+        workers,
+        initializer=init_worker,
+        initargs=(list(fonts), output_cache, measure_index)
+    )
+    return server
+
+
+def serve(address, **kwargs):
+    """Run server on address until interrupted (see make_server)."""
+    server = make_server(address, **kwargs)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+        if isinstance(address, str):
+            try:
+                os.remove(address)
+            except FileNotFoundError:
+                pass
+
+
+class RenderClient:
+    """Send jobs to a render server, one at a time."""
+
+    def __init__(self, address, timeout=None):
+        """Connect to server at address."""
+        if isinstance(address, str):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(address)
+        else:
+            self._sock = socket.create_connection(tuple(address))
+        self._sock.settimeout(timeout)
+        self._rfile = self._sock.makefile("rb")
+        self._next_id = 0
+
+    def request(self, job, returns=return_path):
+        """Send job and wait for its response."""
+        request_id = self._next_id
+        self._next_id += 1
+        self._sock.sendall(json.dumps({
+            "id": request_id,
+            "job": job,
+            "return": returns,
+        }).encode() + b"\n")
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError("render server closed the connection")
+        return json.loads(line)
+
+    def render(self, **job):
+        """Render job into a file, returning its props.
+
+        A relative fname is resolved against the client's directory, which
+        a server with an output root only accepts inside of it.
+        """
+        job["fname"] = os.path.abspath(job["fname"])
+        response = self.request(job)
+        try:
+            return response["props"]
+        except KeyError:
+            raise RuntimeError(response["error"])
+
+    def render_bytes(self, **job):
+        """Render job in memory, returning (props, encoded image)."""
+        response = self.request(job, return_bytes)
+        try:
+            return response["props"], base64.b64decode(response["image"])
+        except KeyError:
+            raise RuntimeError(response["error"])
+
+    def close(self):
+        """Close connection."""
+        self._rfile.close()
+        self._sock.close()
+
+    def __enter__(self):
+        """Use client as context manager."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close connection."""
+        self.close()
+
+
+def main(argv=None):
+    """Run server from the command line."""
+    parser = argparse.ArgumentParser(description="Serve render requests.")
+    parser.add_argument("--socket", help="path of a Unix socket")
+    parser.add_argument("--port", type=int, help="TCP port on localhost")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--font", action="append", default=[],
+                        help="font_name:size to load up front")
+    parser.add_argument("--output-cache", help="output cache directory")
+    parser.add_argument("--measure-index", help="measure index database")
+    parser.add_argument("--output-root",
+                        help="directory job outputs are confined to")
+    args = parser.parse_args(argv)
+    if (args.socket is None) == (args.port is None):
+        parser.error("give one of --socket and --port")
+
+    address = args.socket or ("127.0.0.1", args.port)
+    serve(
+        address,
+        workers=args.workers,
+        fonts=parse_fonts(args.font),
+        output_cache=args.output_cache,
+        measure_index=args.measure_index,
+        output_root=args.output_root
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
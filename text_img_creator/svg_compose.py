@@ -0,0 +1,95 @@
+"""Compose SVG documents in memory."""
+import xml.etree.ElementTree as ET
+
+svg_ns = "http://www.w3.org/2000/svg"
+ET.register_namespace("", svg_ns)
+
+
+def strip_unit(length):
+    """Get number of an SVG length such as "12pt"."""
+    length = str(length).strip()
+    for i, c in enumerate(length):
+        if not (c.isdigit() or c in ".-+eE"):
+            length = length[:i]
+            break
+    return float(length)
+
+
+def format_number(n, digits=4):
+    """Format number rounded to digits decimals, without a trailing .0."""
+    n = round(n, digits)
+    return str(int(n)) if n == int(n) else str(n)
+
+
+def nest_svg(svg, x, y, width, height):
+    """Wrap parsed svg document in an <svg> element placed at x, y."""
+    root = ET.fromstring(svg)
+    view_box = root.get("viewBox")
+    if view_box is None:
+        view_box = " ".join([
+            "0",
+            "0",
+            format_number(strip_unit(root.get("width", width))),
+            format_number(strip_unit(root.get("height", height)))
+        ])
+
+    nested = ET.Element("{%s}svg" % svg_ns, {
+        "x": format_number(x),
+        "y": format_number(y),
+        "width": format_number(width),
+        "height": format_number(height),
+        "viewBox": view_box,
+        "preserveAspectRatio": root.get(
+            "preserveAspectRatio",
+            "xMidYMid meet"
+        ),
+    })
+    nested.extend(list(root))
+    return nested
+
+
+def compose_svgs(placements, width, height):
+    """Write (svg, x, y, width, height) placements into one document."""
+    root = ET.Element("{%s}svg" % svg_ns, {
+        "version": "1.1",
+        "width": format_number(width) + "pt",
+        "height": format_number(height) + "pt",
+        "viewBox": "0 0 %s %s" % (format_number(width), format_number(height)),
+    })
+    for svg, x, y, w, h in placements:
+        root.append(nest_svg(svg, x, y, w, h))
+
+    return (
+        '<?xml version="1.0" standalone="no"?>\n' +
+        ET.tostring(root, encoding="unicode") +
+        "\n"
+    )
+
+
+def stack_svgs(horizontal, fragments, sizes, margin=0):
+    """Stack svg fragments of (width, height) sizes in a single pass.
+
+    Fragments are laid out left to right (horizontal) or top to bottom,
+    separated by margin and aligned to the start of the other axis.
+    Returns the document and its width and height.
+    """
+    placements = []
+    offset = 0
+    cross = 0
+    for svg, (w, h) in zip(fragments, sizes):
+        if horizontal:
+            placements.append((svg, offset, 0, w, h))
+            offset += w + margin
+            cross = max(cross, h)
+        else:
+            placements.append((svg, 0, offset, w, h))
+            offset += h + margin
+            cross = max(cross, w)
+    if placements:
+        offset -= margin
+
+    if horizontal:
+        width, height = offset, cross
+    else:
+        width, height = cross, offset
+    return compose_svgs(placements, width, height), width, height
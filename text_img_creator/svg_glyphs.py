@@ -0,0 +1,177 @@
+"""Cache of traced glyph outlines for assembling SVG text."""
+import json
+import os
+from xml.sax.saxutils import quoteattr
+from PIL import Image, ImageDraw
+from text_img_creator import instrument
+from text_img_creator.font_cache import font_digest
+from text_img_creator.lru import LruCache, entry_overhead
+from text_img_creator.svg_compose import format_number
+from text_img_creator.svg_trace import default_svg_col, numpy, trace_mask
+
+default_glyph_cache_bytes = 16 * 1024 * 1024
+glyph_cache_version = 1
+
+
+def outline_bytes(d):
+    """Size a cached outline."""
+    return len(d) + entry_overhead
+
+
+class GlyphCache:
+    """Keep traced glyph outlines keyed by (font, size, glyph).
+
+    Outlines are SVG path data relative to the glyph origin (left of the
+    pen position, at the ascender line as drawn by ImageDraw.text). The
+    least recently used glyphs are dropped once the path data exceeds
+    max_bytes. Fonts are identified by file digest so a cache saved to
+    disk stays valid when fonts move and is ignored when they change.
+    """
+
+    def __init__(self, max_bytes=default_glyph_cache_bytes):
+        """Initialize empty cache."""
+        self._glyphs = LruCache(max_bytes, outline_bytes)
+
+    @property
+    def max_bytes(self):
+        """Get byte cap."""
+        return self._glyphs.max_size
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        """Set byte cap, evicting glyphs beyond it."""
+        self._glyphs.max_size = max_bytes
+
+    @property
+    def bytes(self):
+        """Get bytes taken by cached outlines."""
+        return self._glyphs.size
+
+    @property
+    def hits(self):
+        """Get number of lookups that found their glyph."""
+        return self._glyphs.hits
+
+    @property
+    def misses(self):
+        """Get number of glyphs traced."""
+        return self._glyphs.misses
+
+    @staticmethod
+    def font_key(font):
+        """Identify a FreeTypeFont by file digest, size and face index."""
+        return font_digest(font.path), font.size, font.index
+
+    def get(self, font, glyph):
+        """Get outline of glyph in font, tracing it on a miss."""
+        key = self.font_key(font) + (glyph,)
+        d = self._glyphs.get(key)
+        if d is not None:
+            instrument.count("glyph_cache_hits")
+            return d
+
+        d = trace_glyph(font, glyph)
+        instrument.count("glyph_cache_misses")
+        return self._glyphs.put(key, d)
+
+    def __len__(self):
+        """Get number of cached glyphs."""
+        return len(self._glyphs)
+
+    def clear(self):
+        """Drop all glyphs and reset counters."""
+        self._glyphs.clear()
+
+    def save(self, path):
+        """Write cached glyphs to path (atomically)."""
+        glyphs = [list(k) + [d] for k, d in self._glyphs.items()]
+        tmp_path = path + ".tmp" + str(os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump({"version": glyph_cache_version, "glyphs": glyphs}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Add glyphs saved at path, if it exists."""
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        if saved.get("version") != glyph_cache_version:
+            return
+
+        for digest, size, index, glyph, d in saved["glyphs"]:
+            self._glyphs.put((digest, size, index, glyph), d)
+
+
+glyph_cache = GlyphCache()
+
+
+def trace_glyph(font, glyph):
+    """Rasterize and trace a single glyph relative to its origin."""
+    if numpy is None:
+        raise ImportError("tracing in python requires numpy")
+    left, top, right, bottom = font.getbbox(glyph)
+    if right <= left or bottom <= top:
+        return ""
+
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), glyph, font=font, fill=255)
+    return trace_mask(numpy.asarray(mask) >= 128, (left, top))
+
+
+def glyph_positions(font, text):
+    """Get pen offset of each character of text, including kerning."""
+    positions = []
+    pen = 0.0
+    prev = None
+    for c in text:
+        if prev is not None:
+            pen += font.getlength(prev + c) - font.getlength(c)
+        positions.append(pen)
+        prev = c
+    return positions
+
+
+def glyphs_to_svg(runs, font, width, height, cache=glyph_cache):
+    """Assemble svg document of text runs from cached glyph outlines.
+
+    runs holds (x, y, text, fill) tuples, positioned like ImageDraw.text.
+    Each distinct glyph is defined once and placed with <use>.
+    """
+    ids = {}
+    defs = []
+    groups = []
+    for x, y, text, fill in runs:
+        uses = []
+        for c, pen in zip(text, glyph_positions(font, text)):
+            d = cache.get(font, c)
+            if not d:
+                continue
+            try:
+                glyph_id = ids[c]
+            except KeyError:
+                glyph_id = ids[c] = "g" + str(len(ids))
+                defs.append(
+                    '<path id="' + glyph_id + '" d="' + d + '"/>'
+                )
+            uses.append(
+                '<use xlink:href="#' + glyph_id + '" x="' +
+                format_number(x + pen, 2) + '" y="' +
+                format_number(y, 2) + '"/>'
+            )
+        groups.append(
+            '<g fill=' + quoteattr(fill or default_svg_col) +
+            ' stroke="none">' + "".join(uses) + "</g>"
+        )
+
+    return (
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<svg version="1.1" xmlns="http://www.w3.org/2000/svg"'
+        ' xmlns:xlink="http://www.w3.org/1999/xlink"\n'
+        ' width="' + str(width) + 'pt" height="' + str(height) + 'pt"'
+        ' viewBox="0 0 ' + str(width) + " " + str(height) + '"\n'
+        ' preserveAspectRatio="xMidYMid meet">\n'
+        "<defs>" + "".join(defs) + "</defs>\n" +
+        "\n".join(groups) + "\n</svg>\n"
+    )
@@ -0,0 +1,151 @@
+"""Trace bitmaps to SVG in process, without temporary files."""
+import subprocess
+from io import BytesIO
+from text_img_creator import instrument
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+default_svg_col = "#000000"
+default_black_level = 0.5
+svg_template = (
+    '<?xml version="1.0" standalone="no"?>\n'
+    '<svg version="1.1" xmlns="http://www.w3.org/2000/svg"\n'
+    ' width="{width}pt" height="{height}pt" viewBox="0 0 {width} {height}"\n'
+    ' preserveAspectRatio="xMidYMid meet">\n'
+    '<path fill="{fill}" stroke="none" d="{d}"/>\n'
+    '</svg>\n'
+)
+
+
+def ink_mask(img, black_level=default_black_level):
+    """Get boolean array of pixels potrace would consider black.
+
+    Like potrace's BMP reader, alpha is ignored and a pixel is ink when the
+    sum of its RGB components is at most black_level of the maximum.
+    """
+    if numpy is None:
+        raise ImportError("tracing in python requires numpy")
+    rgb = numpy.asarray(img.convert("RGB"), dtype=numpy.uint16)
+    return rgb.sum(axis=2) <= 3 * 255 * black_level
+
+
+def trace_mask(mask, offset=(0, 0)):
+    """Trace boolean ink array into SVG path data of its pixel outlines.
+
+    Every boundary between an ink and a blank pixel becomes a unit edge,
+    directed so outlines run clockwise and holes counterclockwise. Edges
+    are chained into closed loops and only the corners are emitted, moved
+    by offset.
+    """
+    ox, oy = offset
+    h, w = mask.shape
+    stride = w + 1
+
+    rows = numpy.zeros((h + 2, w), dtype=bool)
+    rows[1:-1] = mask
+    above, below = rows[:-1], rows[1:]
+    cols = numpy.zeros((h, w + 2), dtype=bool)
+    cols[:, 1:-1] = mask
+    left, right = cols[:, :-1], cols[:, 1:]
+
+    starts = []
+    ends = []
+    for edges, start_offset, step in (
+        (below & ~above, 0, 1),
+        (above & ~below, 1, -1),
+        (left & ~right, 0, stride),
+        (right & ~left, stride, -stride),
+    ):
+        ys, xs = numpy.nonzero(edges)
+        s = ys * stride + xs + start_offset
+        starts.append(s)
+        ends.append(s + step)
+
+    outgoing = {}
+    for s, e in zip(
+        numpy.concatenate(starts).tolist(),
+        numpy.concatenate(ends).tolist()
+    ):
+        try:
+            outgoing[s].append(e)
+        except KeyError:
+            outgoing[s] = [e]
+
+    d = []
+    while outgoing:
+        start = next(iter(outgoing))
+        loop = [start]
+        v = start
+        while True:
+            out = outgoing[v]
+            e = out.pop()
+            if not out:
+                del outgoing[v]
+            if e == start:
+                break
+            loop.append(e)
+            v = e
+
+        n = len(loop)
+        corners = [
+            loop[i] for i in range(n)
+            if loop[i] - loop[i - 1] != loop[(i + 1) % n] - loop[i]
+        ]
+        y, x = divmod(corners[0], stride)
+        d.append("M" + str(x + ox) + " " + str(y + oy))
+        for c in corners[1:]:
+            cy, cx = divmod(c, stride)
+            if cy == y:
+                d.append("H" + str(cx + ox))
+            else:
+                d.append("V" + str(cy + oy))
+            y, x = cy, cx
+        d.append("Z")
+
+    return "".join(d)
+
+
+def trace_to_svg(img, svg_col=None, black_level=default_black_level):
+    """Trace PIL image into an SVG document filled with svg_col."""
+    mask = ink_mask(img, black_level)
+    width, height = img.size
+    return svg_template.format(
+        width=width,
+        height=height,
+        fill=svg_col or default_svg_col,
+        d=trace_mask(mask)
+    )
+
+
+def potrace_svg(img, svg_col=None):
+    """Trace PIL image by piping it through one potrace process.
+
+    The output matches the convert_to_svg script byte for byte: potrace
+    sees the same pixels and the color is substituted the way the
+    script's sed call does, once per line.
+    """
+    bmp = BytesIO()
+    img.convert("RGB").save(bmp, "BMP")
+    instrument.count("subprocesses")
+    svg = subprocess.run(
+        ["potrace", "-s", "-o", "-"],
+        input=bmp.getvalue(),
+        stdout=subprocess.PIPE,
+        check=True
+    ).stdout.decode()
+
+    if svg_col:
+        svg = "".join(
+            line.replace(default_svg_col, svg_col, 1)
+            for line in svg.splitlines(True)
+        )
+    return svg
+
+
+tracers = {
+    "potrace": potrace_svg,
+    "python": trace_to_svg,
+}
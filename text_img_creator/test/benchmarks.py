@@ -0,0 +1,444 @@
+"""Benchmarks of the rendering hot paths.
+
+Run with python3 -m text_img_creator.test.benchmarks. Every benchmark
+reports wall time, the number of subprocesses started in one call and
+how much the resident set size grows during one call. The memory is
+measured in a fresh process per benchmark, as it includes Pillow's pixel
+buffers, which tracemalloc does not see, and the peak of a process only
+ever grows. Results can be saved as JSON (--output) and checked against
+an earlier run (--compare), failing when a benchmark got slower (or uses
+more memory) by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from PIL import Image
+import PIL
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageText, run_command_on_imgs
+from text_img_creator.tiled import make_tiled_image
+from text_img_creator.prop_store import format_export, set_flush_interval
+from text_img_creator.svg_trace import numpy
+
+bench_fonts_dir = os.path.join(os.path.dirname(__file__), "fonts")
+bench_font = os.path.join(bench_fonts_dir, "Lato-Regular.ttf")
+bench_text = "The quick brown fox jumps over the lazy dog"
+# Lines of an image many strips tall, for comparing peak memory
+tall_lines = 40
+tall_font_size = 150
+# One line many strips tall, for comparing peak memory with its mask
+wide_font_size = 1500
+wide_strip_height = 32
+default_repeat = 3
+default_threshold = 0.2
+# Growth below these absolute amounts is noise, not a regression
+compared_metrics = {"time_median": 0.001, "peak_rss_kb": 1024}
+
+benchmarks = {}
+
+
+def benchmark(name):
+    """Register setup function under name.
+
+    The setup function gets a temporary working directory and returns the
+    callable to time, or None if the benchmark can not run here.
+    """
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+@contextmanager
+def count_subprocesses():
+    """Count processes started through subprocess while in context."""
+    counter = [0]
+    execute_child = subprocess.Popen._execute_child
+
+    def counting_execute_child(*args, **kwargs):
+        counter[0] += 1
+        return execute_child(*args, **kwargs)
+
+    subprocess.Popen._execute_child = counting_execute_child
+    try:
+        yield counter
+    finally:
+        subprocess.Popen._execute_child = execute_child
+
+
+def max_rss_kb():
+    """Get maximum resident set size of this process in KiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    return rss
+
+
+def reset_max_rss():
+    """Reset maximum resident set size to the current one, if possible.
+
+    Only Linux allows this; elsewhere max_rss_kb keeps the peak so far.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def benchmark_dir():
+    """Run in a temporary directory with the environment benchmarks use."""
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ["img_properties"] = os.path.join(tmp, "properties")
+        os.environ["default_img_format"] = ".png"
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+def measure_rss(name):
+    """Get growth of the resident set size (KiB) in one call of name.
+
+    Meant to run in a process of its own, see rss_growth_kb.
+    """
+    set_flush_interval(0)
+    with benchmark_dir() as tmp:
+        func = benchmarks[name](tmp)
+        reset_max_rss()
+        before = max_rss_kb()
+        func()
+        return max(max_rss_kb() - before, 0)
+
+
+def rss_growth_kb(name):
+    """Run measure_rss for benchmark name in a fresh process."""
+    out = subprocess.run(
+        [sys.executable, "-m", __spec__.name, "--rss", name],
+        stdout=subprocess.PIPE,
+        check=True
+    ).stdout
+    return int(out)
+
+
+def no_seperation(x):
+    """Put no space between lines."""
+    return 0
+
+
+def lines(n, target_height=32):
+    """Create n lines of benchmark text."""
+    return [
+        ImageText(str(i) + " " + bench_text, target_height=target_height)
+        for i in range(n)
+    ]
+
+
+for target_height in [16, 64, 256]:
+    @benchmark("determine_min_image_size[height=" + str(target_height) + "]")
+    def setup_min_size(tmp, target_height=target_height):
+        text = lines(1, target_height)
+        return lambda: tic.determine_min_image_size(
+            text,
+            no_seperation,
+            font_name=bench_font
+        )
+
+for target_width in [200, 2000]:
+    @benchmark("determine_min_image_size[width=" + str(target_width) + "]")
+    def setup_min_width(tmp, target_width=target_width):
+        text = [ImageText(bench_text, target_width=target_width)]
+        return lambda: tic.determine_min_image_size(
+            text,
+            no_seperation,
+            font_name=bench_font
+        )
+
+for n in [1, 10, 100]:
+    @benchmark("make_lean_image[raster,lines=" + str(n) + "]")
+    def setup_raster(tmp, n=n):
+        text = lines(n)
+        return lambda: tic.make_lean_image(
+            os.path.join(tmp, "raster"),
+            text,
+            font_name=bench_font,
+            ext=".png"
+        )
+
+
+def tall_text():
+    """Create lines of an image many strips tall."""
+    return [ImageText(str(i) + " quick brown fox") for i in range(tall_lines)]
+
+
+@benchmark("make_lean_image[raster,tall]")
+def setup_tall(tmp):
+    text = tall_text()
+    return lambda: tic.make_lean_image(
+        os.path.join(tmp, "tall"),
+        text,
+        font_name=bench_font,
+        font_size=tall_font_size,
+        ext=".png"
+    )
+
+
+@benchmark("make_tiled_image[tall]")
+def setup_tiled(tmp):
+    text = tall_text()
+    return lambda: make_tiled_image(
+        os.path.join(tmp, "tiled"),
+        text,
+        font_name=bench_font,
+        font_size=tall_font_size,
+        ext=".png"
+    )
+
+
+def wide_text():
+    """Create single line many strips tall."""
+    return [ImageText("quick brown fox")]
+
+
+@benchmark("make_tiled_image[wide]")
+def setup_wide(tmp):
+    text = wide_text()
+    return lambda: make_tiled_image(
+        os.path.join(tmp, "wide"),
+        text,
+        font_name=bench_font,
+        font_size=wide_font_size,
+        ext=".png",
+        strip_height=wide_strip_height,
+        compress_level=1
+    )
+
+
+for tracer in [tic.python_tracer, tic.potrace_tracer, tic.shell_tracer]:
+    @benchmark("make_lean_image[svg,tracer=" + tracer + "]")
+    def setup_svg(tmp, tracer=tracer):
+        if tracer == tic.python_tracer and numpy is None:
+            return None
+        if tracer == tic.potrace_tracer and not shutil.which("potrace"):
+            return None
+        stacking = tic.single_stacking
+        if tracer == tic.shell_tracer:
+            if not (shutil.which("convert_to_svg") and
+                    shutil.which("svg_concat")):
+                return None
+            stacking = tic.pairwise_stacking
+        text = lines(3)
+        return lambda: tic.make_lean_image(
+            os.path.join(tmp, "svg"),
+            text,
+            font_name=bench_font,
+            ext=".png",
+            convert_to_svg=True,
+            tracer=tracer,
+            svg_stacking=stacking
+        )
+
+for amount in [90, 45]:
+    @benchmark("rotate_img[" + str(amount) + "]")
+    def setup_rotate(tmp, amount=amount):
+        # In memory, so every call rotates the same image
+        props, = tic.make_lean_image(
+            os.path.join(tmp, "rotate"),
+            lines(10),
+            font_name=bench_font,
+            ext=".png",
+            in_memory=True
+        )
+        return lambda: tic.rotate_img(amount, **props)
+
+
+@benchmark("add_border_to_img[1000x1000]")
+def setup_border(tmp):
+    im = Image.new(tic.default_color_mode, (1000, 1000), tic.white_col)
+    return lambda: tic.add_border_to_img(im, tic.black_col)
+
+
+for n in [1000, 100000]:
+    @benchmark("record_image_properties[vars=" + str(n) + "]")
+    def setup_record(tmp, n=n):
+        path = os.path.join(tmp, "properties")
+        with open(path, "w") as f:
+            for i in range(n):
+                f.write(format_export("img_bench" + str(i), str(i)))
+        os.environ["img_properties"] = path
+
+        @tic.record_image_properties
+        def record():
+            return [tic.ImageProps("bench", ".png", 1, 1)]
+        return record
+
+for workers in [1, 4]:
+    @benchmark("run_command_on_imgs[workers=" + str(workers) + "]")
+    def setup_commands(tmp, workers=workers):
+        src = os.path.join(tmp, "imgs")
+        os.mkdir(src)
+        for i in range(20):
+            Image.new("RGB", (8, 8)).save(os.path.join(src, str(i) + ".png"))
+
+        def create_command(fname, fext):
+            output_file = fname + "_copy" + fext
+            return output_file, ["cp", fname + fext, output_file]
+
+        def run():
+            argv = sys.argv
+            sys.argv = argv[:1]
+            try:
+                return run_command_on_imgs(
+                    create_command,
+                    lambda f, e: not f.endswith("_copy"),
+                    src,
+                    workers=workers
+                )
+            finally:
+                sys.argv = argv
+        return run
+
+
+def run_benchmark(name, repeat=default_repeat):
+    """Time benchmark name repeat times in a temporary directory."""
+    with benchmark_dir() as tmp:
+        func = benchmarks[name](tmp)
+        if func is None:
+            return None
+
+        # Count in a warm up run of its own
+        with count_subprocesses() as started:
+            func()
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+    return {
+        "repeat": repeat,
+        "time_min": min(times),
+        "time_median": statistics.median(times),
+        "peak_rss_kb": rss_growth_kb(name),
+        "subprocesses": started[0],
+    }
+
+
+def run_benchmarks(names=None, repeat=default_repeat, report=None):
+    """Run benchmarks (all or those whose name contains one of names)."""
+    set_flush_interval(0)
+    results = {}
+    for name in benchmarks:
+        if names and not any(n in name for n in names):
+            continue
+        result = run_benchmark(name, repeat)
+        if result is None:
+            continue
+        results[name] = result
+        if report is not None:
+            report(name, result)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(base, new, threshold=default_threshold):
+    """Get regressions of run new against run base.
+
+    Returns (name, metric, base value, new value) for every compared
+    metric that grew by more than threshold (a fraction) and more than
+    its entry in compared_metrics.
+    """
+    regressions = []
+    for name, result in new["results"].items():
+        try:
+            base_result = base["results"][name]
+        except KeyError:
+            continue
+        for metric, slack in compared_metrics.items():
+            old, value = base_result[metric], result[metric]
+            if value > old * (1 + threshold) and value - old > slack:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def format_result(name, result):
+    """Format result line."""
+    return "{:<48} {:>10.2f} ms {:>10} KiB rss {:>4} procs".format(
+        name,
+        result["time_median"] * 1000,
+        result["peak_rss_kb"],
+        result["subprocesses"]
+    )
+
+
+def main(argv=None):
+    """Run benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="names", action="append",
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument("-n", "--repeat", type=int, default=default_repeat)
+    parser.add_argument("-o", "--output", help="save results as json")
+    parser.add_argument("--compare", help="json results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=default_threshold,
+                        help="allowed growth, as a fraction")
+    parser.add_argument("--rss", metavar="NAME", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.rss:
+        print(measure_rss(args.rss))
+        return 0
+
+    run = run_benchmarks(
+        args.names,
+        args.repeat,
+        lambda name, result: print(format_result(name, result), flush=True)
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        regressions = compare(base, run, args.threshold)
+        for name, metric, old, value in regressions:
+            print("regression:", name, metric, old, "->", value)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
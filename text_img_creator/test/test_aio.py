@@ -0,0 +1,89 @@
+"""asyncio variants of the rendering functions."""
+import asyncio
+import shutil
+import pytest
+import text_img_creator as tic
+from text_img_creator import aio
+from text_img_creator.svg_trace import numpy
+from text_img_creator.test.benchmarks import bench_font
+
+text = [tic.ImageText("Ag jy"), tic.ImageText("gap", color=(200, 0, 0, 255))]
+needs_svg_concat = pytest.mark.skipif(
+    not (shutil.which("svg_concat") and shutil.which("svg_stack")),
+    reason="needs svg_concat and svg_stack"
+)
+
+
+@pytest.mark.skipif(numpy is None, reason="needs numpy")
+@pytest.mark.parametrize("stacking", [
+    tic.single_stacking,
+    pytest.param(tic.pairwise_stacking, marks=needs_svg_concat),
+])
+@pytest.mark.parametrize("horizontal", [False, True])
+def test_svg_lines_match_blocking(tmp_path, monkeypatch, stacking, horizontal):
+    monkeypatch.chdir(tmp_path)
+    kwargs = dict(
+        font_name=bench_font,
+        font_size=30,
+        ext=".png",
+        convert_to_svg=True,
+        svg_mode=tic.lines_svg,
+        tracer=tic.python_tracer,
+        svg_stacking=stacking,
+        horizontal=horizontal
+    )
+    calls = []
+    make_svg_lines = aio.make_svg_lines
+
+    async def traced_per_line(*args, **kwargs):
+        calls.append(args)
+        return await make_svg_lines(*args, **kwargs)
+
+    monkeypatch.setattr(aio, "make_svg_lines", traced_per_line)
+    blocking, = tic.make_lean_image("blocking", text, **kwargs)
+    concurrent, = asyncio.run(
+        aio.make_lean_image("concurrent", text, **kwargs)
+    )
+    assert len(calls) == 1
+    assert (
+        (tmp_path / "concurrent.svg").read_bytes() ==
+        (tmp_path / "blocking.svg").read_bytes()
+    )
+    assert dict(concurrent) == dict(blocking, fname="concurrent")
+
+
+def test_process_limit_bounds_running_commands(monkeypatch):
+    running = 0
+    most = 0
+
+    class Process:
+        async def wait(self):
+            nonlocal running
+            await asyncio.sleep(0.01)
+            running -= 1
+            return 0
+
+    async def create_subprocess_exec(*c):
+        nonlocal running, most
+        running += 1
+        most = max(most, running)
+        return Process()
+
+    async def run_all():
+        return await asyncio.gather(
+            *(aio.run_command(["true"]) for _ in range(8))
+        )
+
+    monkeypatch.setattr(
+        asyncio,
+        "create_subprocess_exec",
+        create_subprocess_exec
+    )
+    try:
+        for limit in (1, 3, 8):
+            aio.set_process_limit(limit)
+            most = 0
+            assert asyncio.run(run_all()) == [0] * 8
+            assert most == limit
+    finally:
+        aio.set_process_limit(aio.default_process_limit)
@@ -0,0 +1,106 @@
+"""Frames of animations drawn incrementally."""
+import pytest
+from PIL import Image
+from text_img_creator import frame_fname_base
+from text_img_creator.animation import render_animation
+from text_img_creator.img_utils import ImageText
+from text_img_creator.test.benchmarks import bench_font
+
+frames = [
+    ["Ag jy", "Wolf", "gap"],
+    ["Ag jy", "W", "gap"],
+    ["Ag jy", "W", "gap"],
+    [ImageText("Ag jy", color=(200, 0, 0, 255)), "Wolfgang", "gap"],
+    ["Qq", "Wolfgang", "yyy"],
+]
+
+
+def same(a, b):
+    """Check whether images a and b have the same pixels."""
+    return a.size == b.size and a.tobytes() == b.tobytes()
+
+
+@pytest.mark.parametrize("horizontal", [False, True])
+def test_frames_match_full_redraws(tmp_path, monkeypatch, horizontal):
+    monkeypatch.chdir(tmp_path)
+    render_animation(
+        "anim",
+        frames,
+        font_name=bench_font,
+        font_size=40,
+        ext=".png",
+        frame_ext=".png",
+        horizontal=horizontal
+    )
+    drawn = [
+        Image.open(frame_fname_base + str(i) + ".png").convert("RGBA")
+        for i in range(len(frames))
+    ]
+
+    for i, lines in enumerate(frames):
+        render_animation(
+            "full",
+            [lines],
+            font_name=bench_font,
+            font_size=40,
+            ext=None,
+            frame_ext=".full.png",
+            layout=[ImageText(str(t)) for t in frames[0]],
+            horizontal=horizontal
+        )
+        full = Image.open(frame_fname_base + "0.full.png").convert("RGBA")
+        assert same(drawn[i], full), i
+
+    with Image.open("anim.png") as anim:
+        assert anim.n_frames == len(frames)
+        for i in range(len(frames)):
+            anim.seek(i)
+            assert same(anim.convert("RGBA"), drawn[i]), i
+
+
+def test_layout_of_strings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    render_animation(
+        "str",
+        [["1"], ["8"]],
+        font_name=bench_font,
+        font_size=40,
+        ext=".png",
+        layout=["888"]
+    )
+    render_animation(
+        "text",
+        [["1"], ["8"]],
+        font_name=bench_font,
+        font_size=40,
+        ext=".png",
+        layout=[ImageText("888")]
+    )
+    with Image.open("str.png") as a, Image.open("text.png") as b:
+        assert a.n_frames == b.n_frames == 2
+        for i in range(2):
+            a.seek(i)
+            b.seek(i)
+            assert same(a.convert("RGBA"), b.convert("RGBA")), i
+
+
+@pytest.mark.parametrize("lines", [["Wolf"], ["Wolf", "gap", "Qq"]])
+def test_frames_must_match_layout_lines(tmp_path, monkeypatch, lines):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="frame 1 has"):
+        render_animation(
+            "anim",
+            [["Ag jy", "gap"], lines],
+            font_name=bench_font,
+            font_size=40,
+            ext=".png"
+        )
+    with pytest.raises(ValueError, match="frame 0 has"):
+        render_animation(
+            "anim",
+            [lines],
+            font_name=bench_font,
+            font_size=40,
+            ext=".png",
+            layout=["Ag jy", "gap"]
+        )
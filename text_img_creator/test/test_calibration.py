@@ -0,0 +1,98 @@
+"""Compare log calibration against the linear walk."""
+import pytest
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageText
+from text_img_creator.test.benchmarks import bench_font
+
+texts = ["ily", "0", "Ag", "Wolf", "fox jumps"]
+targets = [
+    (77, None),
+    (300, None),
+    (None, 5),
+    (None, 12),
+    (None, 40),
+    (None, 120),
+    (150, 30),
+]
+paddings = [(0,), (2, 5)]
+
+
+def calibrate(
+    text,
+    target_width,
+    target_height,
+    padding,
+    calibration,
+    measure=tic.bbox_measure
+):
+    """Get the size text is rendered at and its measurement."""
+    _, _, (t,), f = tic.determine_min_image_size(
+        [ImageText(
+            text,
+            target_width=target_width,
+            target_height=target_height,
+            padding=padding
+        )],
+        lambda x: 0,
+        font_name=bench_font,
+        calibration=calibration,
+        measure=measure
+    )
+    return f.size, t
+
+
+@pytest.mark.parametrize("measure", [tic.bbox_measure, tic.metrics_measure])
+@pytest.mark.parametrize("padding", paddings)
+@pytest.mark.parametrize("target_width,target_height", targets)
+@pytest.mark.parametrize("text", texts)
+def test_log_matches_linear(
+    text,
+    target_width,
+    target_height,
+    padding,
+    measure
+):
+    case = (text, target_width, target_height, padding)
+    linear, linear_t = calibrate(
+        text,
+        target_width,
+        target_height,
+        padding,
+        tic.linear_calibration,
+        measure
+    )
+    log, log_t = calibrate(
+        text,
+        target_width,
+        target_height,
+        padding,
+        tic.log_calibration,
+        measure
+    )
+    assert log == linear, case
+    assert (log_t.width, log_t.height, log_t.sx, log_t.sy) == (
+        linear_t.width,
+        linear_t.height,
+        linear_t.sx,
+        linear_t.sy
+    ), case
+    # Only sizes too small to cover whole pixels need more than a few
+    assert log_t.probes <= 8 or log < 20, case
+
+
+def test_log_matches_linear_below_max_size():
+    text = [
+        ImageText("Wolf", target_height=20),
+        ImageText("fox jumps", target_width=600),
+    ]
+    layouts = [
+        tic.determine_min_image_size(
+            text,
+            lambda x: 0,
+            font_name=bench_font,
+            calibration=calibration
+        )
+        for calibration in (tic.linear_calibration, tic.log_calibration)
+    ]
+    (lw, lh, _, lf), (gw, gh, _, gf) = layouts
+    assert (lw, lh, lf.size) == (gw, gh, gf.size)
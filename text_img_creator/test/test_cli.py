@@ -0,0 +1,92 @@
+"""Manifests rendered from the command line."""
+import json
+from io import StringIO
+import pytest
+from text_img_creator.cli import main, render_manifest
+from text_img_creator.test.benchmarks import bench_font
+
+
+def job(fname, **kwargs):
+    """Create manifest line of a job rendering fname."""
+    spec = {
+        "fname": fname,
+        "text": ["Ag jy", "gap"],
+        "font_name": bench_font,
+        "font_size": 40,
+        "ext": ".png",
+    }
+    spec.update(kwargs)
+    return json.dumps(spec) + "\n"
+
+
+def manifest(tmp_path):
+    """Create manifest of jobs, a parse error, a done job and a failure."""
+    (tmp_path / "done.png").write_bytes(b"")
+    return "".join([
+        job(str(tmp_path / "first"), font_size=400),
+        "{not json\n",
+        job(str(tmp_path / "done")),
+        job(str(tmp_path / "second")),
+        "\n",
+        job(str(tmp_path / "broken"), font_name="no such font.ttf"),
+        job(str(tmp_path / "third")),
+    ])
+
+
+def outcome(result):
+    """Get line number and kind of result."""
+    kind, = set(result) - {"line"}
+    return result["line"], kind
+
+
+expected = [
+    (1, "props"),
+    (2, "error"),
+    (3, "skipped"),
+    (4, "props"),
+    (6, "error"),
+    (7, "props"),
+]
+
+
+@pytest.mark.parametrize("workers,ordered", [
+    (1, False),
+    (2, True),
+    (3, False),
+])
+def test_results(tmp_path, workers, ordered):
+    out = StringIO()
+    failed = render_manifest(
+        StringIO(manifest(tmp_path)),
+        out,
+        workers,
+        ordered,
+        resume=True
+    )
+    assert failed == 2
+    results = [outcome(json.loads(r)) for r in out.getvalue().splitlines()]
+    if workers <= 1 or ordered:
+        assert results == expected
+    else:
+        assert sorted(results) == expected
+    assert (tmp_path / "third.png").exists()
+
+
+def test_exit_status_and_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "jobs.jsonl").write_text(job("a") + job("b"))
+    assert main(["jobs.jsonl", "-o", "results.jsonl"]) == 0
+    assert main(["jobs.jsonl", "-o", "results.jsonl", "--resume"]) == 0
+    results = [
+        outcome(json.loads(r))
+        for r in (tmp_path / "results.jsonl").read_text().splitlines()
+    ]
+    assert results == [
+        (1, "props"),
+        (2, "props"),
+        (1, "skipped"),
+        (2, "skipped"),
+    ]
+
+    (tmp_path / "jobs.jsonl").write_text(job("c") + "{not json\n")
+    assert main(["jobs.jsonl", "-o", "results.jsonl", "-w", "2"]) == 1
@@ -0,0 +1,36 @@
+"""Font cache behaviour under calibration."""
+import text_img_creator as tic
+from text_img_creator.font_cache import FontCache, font_cache
+from text_img_creator.img_utils import ImageText
+from text_img_creator.test.benchmarks import bench_font
+
+
+def test_repeated_linear_walks_hit_the_cache():
+    font_cache.clear()
+    texts = ["abc", "Wolf", "fox"]
+    for t in texts:
+        tic.determine_min_image_size(
+            [ImageText(t, target_height=200)],
+            lambda x: 0,
+            font_name=bench_font
+        )
+    misses = font_cache.info().misses
+    for t in texts:
+        tic.determine_min_image_size(
+            [ImageText(t, target_height=200)],
+            lambda x: 0,
+            font_name=bench_font
+        )
+    assert font_cache.info().misses == misses
+
+
+def test_least_recently_used_font_is_evicted():
+    cache = FontCache(2)
+    cache.get(bench_font, 10)
+    cache.get(bench_font, 11)
+    cache.get(bench_font, 10)
+    cache.get(bench_font, 12)
+    cache.get(bench_font, 10)
+    cache.get(bench_font, 11)
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (2, 4, 2)
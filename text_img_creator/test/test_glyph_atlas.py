@@ -0,0 +1,92 @@
+"""Text drawn from cached glyph masks."""
+import pytest
+from PIL import Image, ImageDraw
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageText
+from text_img_creator.test.benchmarks import bench_font
+
+glyph_atlas = pytest.importorskip("text_img_creator.glyph_atlas")
+
+texts = ["AVATAR To.", "Wolf jumps", "fi fl ffi", "gyp Qq", ".."]
+positions = [(3, 2), (3.5, 2), (3.25, 2.5), (3.9, 2.75), (0.51, 0.49)]
+backgrounds = [
+    ("RGB", (255, 255, 255)),
+    ("RGBA", (0, 0, 0, 0)),
+    ("RGBA", (255, 255, 255, 128)),
+]
+
+
+@pytest.mark.parametrize("size", [7, 9, 24])
+@pytest.mark.parametrize("mode,background", backgrounds)
+def test_draw_matches_imagedraw(size, mode, background):
+    atlas = glyph_atlas.GlyphAtlas()
+    font = tic.get_font(bench_font, size)
+    for t in texts:
+        for xy in positions:
+            expected = Image.new(mode, (size * 12, size * 3), background)
+            drawn = expected.copy()
+            ImageDraw.Draw(expected).text(xy, t, font=font, fill=(10, 40, 200))
+            atlas.draw(drawn, xy, t, font, (10, 40, 200))
+            assert drawn.tobytes() == expected.tobytes(), (t, xy)
+
+
+@pytest.mark.parametrize("clip", [False, True])
+def test_strips_match_imagedraw(clip):
+    atlas = glyph_atlas.GlyphAtlas()
+    font = tic.get_font(bench_font, 24)
+    size = (300, 80)
+    for t in texts:
+        # Strips below the text's start get it at whole negative rows
+        for x, y in [(x, int(y)) for x, y in positions]:
+            expected = Image.new("RGBA", size, (255, 255, 255, 128))
+            ImageDraw.Draw(expected).text(
+                (x, y + 20),
+                t,
+                font=font,
+                fill="red"
+            )
+            for top in range(0, size[1], 7):
+                strip = Image.new("RGBA", (size[0], 7), (255, 255, 255, 128))
+                atlas.draw(strip, (x, y + 20 - top), t, font, "red", clip)
+                bottom = min(top + 7, size[1])
+                assert (
+                    strip.crop((0, 0, size[0], bottom - top)).tobytes() ==
+                    expected.crop((0, top, size[0], bottom)).tobytes()
+                ), (t, x, y, top)
+
+
+@pytest.mark.parametrize("font_size", [9, 13, 40])
+def test_make_lean_image_matches_without_atlas(font_size):
+    # Lines of different widths are centred at half pixels
+    text = [ImageText(t) for t in ["AVATAR To.", "Wolf", "gyp Qqj", "i"]]
+    images = []
+    for atlas in (None, glyph_atlas.GlyphAtlas()):
+        ip, = tic.make_lean_image(
+            "atlas",
+            text,
+            font_name=bench_font,
+            font_size=font_size,
+            ext=".png",
+            in_memory=True,
+            glyph_atlas=atlas
+        )
+        images.append(ip[tic.img_key])
+    assert images[0].tobytes() == images[1].tobytes()
+
+
+def test_pairs_count_towards_footprint():
+    atlas = glyph_atlas.GlyphAtlas()
+    font = tic.get_font(bench_font, 12)
+    atlas.line_mask(font, "abc")
+    info = atlas.info()
+    masks = sum(
+        entry[0].nbytes
+        for _, entry in atlas._entries.items()
+        if not isinstance(entry, int)
+    )
+    assert (info.glyphs, info.pairs) == (3, 2)
+    assert info.bytes == masks + 5 * glyph_atlas.entry_overhead
+
+    small = glyph_atlas.GlyphAtlas(max_bytes=info.bytes - 1)
+    small.line_mask(font, "abc")
+    assert small.info().bytes <= small.max_bytes
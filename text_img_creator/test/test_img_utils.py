@@ -0,0 +1,39 @@
+"""Running commands on image files."""
+import sys
+from text_img_creator.img_utils import run_command_on_imgs
+
+
+def make_images(tmp_path, monkeypatch):
+    """Create a.png and b.png, listing tmp_path instead of sys.argv."""
+    monkeypatch.setattr(sys, "argv", ["prog"])
+    for name in ("a.png", "b.png"):
+        (tmp_path / name).write_bytes(b"")
+    return str(tmp_path)
+
+
+def create_command(fname, fext):
+    """Fail on b.png."""
+    status = "false" if fname.endswith("b") else "true"
+    return fname + ".out", [status]
+
+
+def test_failed_outputs_returned_without_failures_list(tmp_path, monkeypatch):
+    source = make_images(tmp_path, monkeypatch)
+    outputs = run_command_on_imgs(create_command, source_dir_path=source)
+    assert sorted(outputs) == [
+        str(tmp_path / "a.out"),
+        str(tmp_path / "b.out"),
+    ]
+
+
+def test_failed_commands_collected(tmp_path, monkeypatch):
+    source = make_images(tmp_path, monkeypatch)
+    failures = []
+    outputs = run_command_on_imgs(
+        create_command,
+        source_dir_path=source,
+        workers=2,
+        failures=failures
+    )
+    assert outputs == [str(tmp_path / "a.out")]
+    assert [f.args for f in failures] == [["false"]]
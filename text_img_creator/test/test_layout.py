@@ -0,0 +1,29 @@
+"""Wrapping text into a box."""
+import pytest
+from text_img_creator import get_font
+from text_img_creator.layout import Paragraphs, fit_text, line_height
+from text_img_creator.test.benchmarks import bench_font
+
+
+def block_fits(text, size, width, height):
+    """Check whether text wrapped at size fits width x height."""
+    font = get_font(bench_font, size)
+    lines = Paragraphs(text).wrap(font, width)
+    return lines is not None and len(lines) * line_height(font) <= height
+
+
+@pytest.mark.parametrize("text", ["", " \n\t "])
+def test_text_without_words_raises(text):
+    with pytest.raises(ValueError):
+        fit_text(text, 200, 100, bench_font)
+
+
+def test_largest_fitting_size_is_found():
+    text = "the quick brown fox\njumps"
+    size, lines = fit_text(text, 200, 100, bench_font)
+    assert [str(t) for t in lines] == Paragraphs(text).wrap(
+        get_font(bench_font, size),
+        200
+    )
+    assert block_fits(text, size, 200, 100)
+    assert not block_fits(text, size + 1, 200, 100)
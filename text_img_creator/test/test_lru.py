@@ -0,0 +1,22 @@
+"""Least recently used caches capped in size."""
+from text_img_creator.lru import LruCache
+
+
+def test_drops_least_recently_used_beyond_cap():
+    cache = LruCache(5, len)
+    cache.put("a", "xx")
+    cache.put("b", "xx")
+    assert cache.get("a") == "xx"
+    cache.put("c", "xx")
+    assert cache.get("b") is None
+    assert [k for k, _ in cache.items()] == ["a", "c"]
+    assert cache.counts() == (1, 1, 2, 4)
+
+    # Entries present keep their value
+    assert cache.put("a", "yy") == "xx"
+    cache.max_size = 2
+    assert [k for k, _ in cache.items()] == ["c"]
+    assert cache.size == 2
+
+    cache.clear()
+    assert cache.counts() == (0, 0, 0, 0)
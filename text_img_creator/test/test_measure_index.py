@@ -0,0 +1,29 @@
+"""Measurements stored in a MeasureIndex."""
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageText
+from text_img_creator.measure_index import MeasureIndex
+from text_img_creator.test.benchmarks import bench_font
+
+
+def calibrate(index, calibration):
+    """Get the render font size of a text whose ink shrinks as it grows."""
+    _, _, _, f = tic.determine_min_image_size(
+        [ImageText("ily", target_width=300, padding=(2, 5))],
+        lambda x: 0,
+        font_name=bench_font,
+        calibration=calibration,
+        measure_index=index
+    )
+    return f.size
+
+
+def test_calibrations_do_not_share_entries(tmp_path):
+    index = MeasureIndex(str(tmp_path / "index.db"))
+    log = calibrate(index, tic.log_calibration)
+    linear = calibrate(index, tic.linear_calibration)
+    assert index.misses == 2
+    assert linear == calibrate(None, tic.linear_calibration)
+    assert log == calibrate(None, tic.log_calibration)
+    assert calibrate(index, tic.linear_calibration) == linear
+    assert index.hits == 1
+    index.close()
@@ -0,0 +1,116 @@
+"""Rendered images stored in an OutputCache."""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import subprocess
+import sys
+import pytest
+import text_img_creator as tic
+from text_img_creator.batch import constant_seperation, load_job
+from text_img_creator.output_cache import OutputCache, value_digest
+from text_img_creator.test.benchmarks import bench_font
+
+
+def test_threads_store_and_fetch_one_entry(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    artifact = tmp_path / "artifact.png"
+    artifact.write_bytes(b"png" * 100000)
+    key = cache.make_key(text="a")
+    props = {"fname": "artifact", "ext": ".png"}
+
+    def store_and_fetch(i):
+        cache.put(key, str(artifact), props)
+        return cache.get(key, str(tmp_path / "out"))
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(store_and_fetch, range(64)))
+    assert all(r is not None for r in results)
+    assert (tmp_path / "out.png").read_bytes() == artifact.read_bytes()
+    assert not [p for p in tmp_path.rglob("*") if ".tmp" in p.name]
+
+
+def test_calibration_changes_the_key(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    text = [tic.ImageText("ily", target_width=300, padding=(2, 5))]
+
+    def render(fname, **kwargs):
+        ip, = tic.make_lean_image(
+            str(tmp_path / fname),
+            text,
+            font_name=bench_font,
+            ext=".png",
+            output_cache=cache,
+            **kwargs
+        )
+        return ip
+
+    render("linear")
+    render("log", calibration=tic.log_calibration)
+    assert (cache.hits, cache.misses) == (0, 2)
+    render("again", calibration=tic.log_calibration)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+key_script = """
+from text_img_creator.batch import load_job
+from text_img_creator.output_cache import OutputCache
+print(OutputCache.make_key(**load_job({"text": "a", "text_seperation": 3})))
+"""
+
+
+def test_partial_keys_match_across_processes():
+    keys = {
+        subprocess.run(
+            [sys.executable, "-c", key_script],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        for _ in range(2)
+    }
+    assert len(keys) == 1
+    key = keys.pop().strip()
+    assert key == OutputCache.make_key(
+        **load_job({"text": "a", "text_seperation": 3})
+    )
+    assert key != OutputCache.make_key(
+        **load_job({"text": "a", "text_seperation": 4})
+    )
+
+
+def spaced(pixels):
+    """Create closure separating lines by pixels."""
+    return lambda size: pixels
+
+
+class Opaque:
+    """Object only identified by its address."""
+
+
+def test_closure_values_change_the_key():
+    assert value_digest(spaced(3)) == value_digest(spaced(3))
+    assert value_digest(spaced(3)) != value_digest(spaced(4))
+    assert value_digest(spaced((1, 2))) != value_digest(spaced((1, 3)))
+    with pytest.raises(TypeError):
+        value_digest(spaced(Opaque()))
+    assert OutputCache.make_key(text_seperation=spaced(Opaque())) is None
+    assert OutputCache.make_key(
+        text_seperation=partial(constant_seperation, Opaque())
+    ) is None
+
+
+def test_inputs_without_digest_skip_the_cache(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    opaque = Opaque()
+    for fname in ("a", "b"):
+        tic.make_lean_image(
+            str(tmp_path / fname),
+            [tic.ImageText("ily"), tic.ImageText("gap")],
+            font_name=bench_font,
+            font_size=20,
+            ext=".png",
+            text_seperation=lambda size: 0 if opaque else 1,
+            output_cache=cache
+        )
+        assert (tmp_path / (fname + ".png")).exists()
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert cache.size() == 0
@@ -0,0 +1,36 @@
+"""Buffered property stores."""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from text_img_creator.prop_store import (
+    PropertyStore,
+    flush_at_worker_exit,
+    get_property_store,
+    set_flush_interval,
+)
+
+
+def buffer_value(path, var, val):
+    """Buffer var=val without flushing."""
+    set_flush_interval(None)
+    get_property_store(path).update({var: val})
+
+
+def test_worker_flushes_on_exit(tmp_path):
+    path = str(tmp_path / "props")
+    with ProcessPoolExecutor(1, initializer=flush_at_worker_exit) as pool:
+        pool.submit(buffer_value, path, "img_width", "12").result()
+    with open(path) as f:
+        assert f.read() == 'export img_width="12"\n'
+
+
+def test_timer_flushes_without_later_update(tmp_path):
+    path = str(tmp_path / "props")
+    store = PropertyStore(path, flush_interval=0.2)
+    store.update({"img_width": "12"})
+    assert not os.path.exists(path)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    with open(path) as f:
+        assert f.read() == 'export img_width="12"\n'
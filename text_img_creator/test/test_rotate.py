@@ -0,0 +1,118 @@
+"""Rotating images with rotate_img."""
+import pytest
+from PIL import Image
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageProps
+
+background = (0, 0, 255, 255)
+red = (255, 0, 0, 255)
+green = (0, 255, 0, 255)
+black = (0, 0, 0, 255)
+width, height = 5, 3
+
+
+def marked():
+    """Create image with three marked corners."""
+    im = Image.new(tic.default_color_mode, (width, height), background)
+    im.putpixel((0, 0), red)
+    im.putpixel((width - 1, 0), green)
+    im.putpixel((0, height - 1), black)
+    return im
+
+
+def rotate(amount, **kwargs):
+    """Rotate marked image in memory, getting the resulting props."""
+    props = ImageProps(
+        "rotated",
+        ".png",
+        width,
+        height,
+        **{tic.back_col_key: background, tic.img_key: marked()}
+    )
+    return tic.rotate_img(amount, **kwargs, **props)
+
+
+def corners(im):
+    """Get where the marked pixels ended up."""
+    found = {}
+    for x in range(im.width):
+        for y in range(im.height):
+            px = im.getpixel((x, y))
+            if px != background:
+                found[px] = (x, y)
+    return found
+
+
+@pytest.mark.parametrize("amount,size,where", [
+    (90, (3, 5), {red: (0, 4), green: (0, 0), black: (2, 4)}),
+    (180, (5, 3), {red: (4, 2), green: (0, 2), black: (4, 0)}),
+    (270, (3, 5), {red: (2, 0), green: (2, 4), black: (0, 0)}),
+    (-90, (3, 5), {red: (2, 0), green: (2, 4), black: (0, 0)}),
+    (360, (5, 3), {red: (0, 0), green: (4, 0), black: (0, 2)}),
+])
+def test_right_angles_move_pixels_exactly(amount, size, where):
+    ip = rotate(amount)
+    im = ip[tic.img_key]
+    assert im.size == size
+    assert (ip[tic.width_key], ip[tic.height_key]) == size
+    assert corners(im) == where
+
+
+@pytest.mark.parametrize("expand", [True, False])
+def test_other_angles_rotate_once_with_background(expand):
+    ip = rotate(30, expand=expand)
+    im = ip[tic.img_key]
+    expected = marked().rotate(30, expand=expand, fillcolor=background)
+    assert im.size == expected.size
+    assert im.tobytes() == expected.tobytes()
+    assert (ip[tic.width_key], ip[tic.height_key]) == im.size
+    if expand:
+        assert im.width > width and im.height > height
+    else:
+        assert im.size == (width, height)
+    # Corners the rotated image does not cover show the background
+    assert im.getpixel((0, 0)) == background
+
+
+def test_padding_extends_right_and_bottom():
+    ip = rotate(90, width_pad=2, height_pad=1)
+    im = ip[tic.img_key]
+    assert im.size == (3 + 2, 5 + 1)
+    assert (ip[tic.width_key], ip[tic.height_key]) == im.size
+    assert corners(im) == {red: (0, 4), green: (0, 0), black: (2, 4)}
+    unpadded = rotate(90)[tic.img_key]
+    assert im.crop((0, 0, 3, 5)).tobytes() == unpadded.tobytes()
+
+
+def test_files_are_rotated_in_place(tmp_path):
+    fname = str(tmp_path / "rotated")
+    marked().save(fname + ".png")
+    ip = tic.rotate_img(
+        180,
+        **ImageProps(
+            fname,
+            ".png",
+            width,
+            height,
+            **{tic.back_col_key: background}
+        )
+    )
+    assert tic.img_key not in ip
+    with Image.open(fname + ".png") as im:
+        assert im.size == (width, height)
+        assert corners(im.convert(tic.default_color_mode)) == {
+            red: (4, 2),
+            green: (0, 2),
+            black: (4, 0),
+        }
+
+
+def test_encoded_images_are_rotated_in_memory():
+    ip = rotate(0)
+    ip[tic.img_key] = tic.encode_img(**ip)
+    ip = tic.rotate_img(90, **ip)
+    assert corners(tic.load_img(ip[tic.img_key])) == {
+        red: (0, 4),
+        green: (0, 0),
+        black: (2, 4),
+    }
@@ -0,0 +1,67 @@
+"""Jobs rendered by a render server over a Unix socket."""
+import os
+import stat
+import threading
+from io import BytesIO
+import pytest
+from PIL import Image
+from text_img_creator.server import RenderClient, make_server
+from text_img_creator.test.benchmarks import bench_font
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Run a render server confined to tmp_path / "out"."""
+    address = str(tmp_path / "render.sock")
+    (tmp_path / "out").mkdir()
+    server = make_server(
+        address,
+        workers=1,
+        output_root=str(tmp_path / "out")
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield address
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    server.pool.shutdown()
+
+
+def test_socket_is_private(server):
+    assert stat.S_IMODE(os.stat(server).st_mode) == 0o600
+
+
+def test_round_trip(server, tmp_path):
+    job = {
+        "text": ["Ag jy", "gap"],
+        "font_name": bench_font,
+        "font_size": 40,
+        "ext": ".png",
+    }
+    with RenderClient(server, timeout=60) as client:
+        props = client.request(dict(job, fname="file"))["props"]
+        fname = str(tmp_path / "out" / "file")
+        assert props["fname"] == fname
+        with Image.open(fname + ".png") as im:
+            assert im.size == (props["width"], props["height"])
+            from_file = im.convert("RGBA").tobytes()
+
+        props, image = client.render_bytes(**job, fname="memory")
+        assert not (tmp_path / "out" / "memory.png").exists()
+        with Image.open(BytesIO(image)) as im:
+            assert im.size == (props["width"], props["height"])
+            assert im.convert("RGBA").tobytes() == from_file
+
+        for escaped in (str(tmp_path / "escaped"), "../escaped"):
+            with pytest.raises(RuntimeError, match="outside"):
+                client.render(**job, fname=escaped)
+        assert not (tmp_path / "escaped.png").exists()
+
+        response = client.request(
+            dict(job, fname="broken", font_name="no such font.ttf")
+        )
+        assert "props" not in response
+        assert "OSError" in response["error"]
+        # The connection stays usable after errors
+        assert "props" in client.request(dict(job, fname="again"))
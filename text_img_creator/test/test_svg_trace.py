@@ -0,0 +1,86 @@
+"""In process SVG tracers."""
+import os
+import shutil
+import subprocess
+import pytest
+from PIL import Image, ImageDraw
+import text_img_creator
+from text_img_creator.font_cache import get_font
+from text_img_creator.svg_trace import (
+    ink_mask,
+    numpy,
+    potrace_svg,
+    trace_mask,
+    trace_to_svg,
+)
+from text_img_creator.test.benchmarks import bench_font
+
+needs_numpy = pytest.mark.skipif(numpy is None, reason="needs numpy")
+convert_to_svg = os.path.join(
+    os.path.dirname(os.path.dirname(text_img_creator.__file__)),
+    "bin",
+    "convert_to_svg"
+)
+
+
+def bitmap(size, ink):
+    """Create white RGB image with black pixels at ink."""
+    im = Image.new("RGB", size, (255, 255, 255))
+    for xy in ink:
+        im.putpixel(xy, (0, 0, 0))
+    return im
+
+
+@needs_numpy
+def test_trace_to_svg_outlines_pixels():
+    im = bitmap((4, 3), [(1, 1), (2, 1)])
+    assert trace_to_svg(im, "#ff0000") == (
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<svg version="1.1" xmlns="http://www.w3.org/2000/svg"\n'
+        ' width="4pt" height="3pt" viewBox="0 0 4 3"\n'
+        ' preserveAspectRatio="xMidYMid meet">\n'
+        '<path fill="#ff0000" stroke="none" d="M1 1H3V2H1Z"/>\n'
+        '</svg>\n'
+    )
+
+
+@needs_numpy
+def test_trace_mask_winds_holes_the_other_way():
+    square = [(x, y) for x in range(1, 4) for y in range(1, 4)]
+    im = bitmap((5, 5), [xy for xy in square if xy != (2, 2)])
+    # Outline clockwise, hole counterclockwise (y grows downwards)
+    assert trace_mask(ink_mask(im)) == "M1 1H4V4H1ZM2 3H3V2H2Z"
+    assert trace_mask(ink_mask(im), (10, 20)) == (
+        "M11 21H14V24H11ZM12 23H13V22H12Z"
+    )
+
+
+@needs_numpy
+def test_ink_mask_ignores_alpha():
+    im = Image.new("RGBA", (3, 1))
+    im.putpixel((0, 0), (0, 0, 0, 0))
+    im.putpixel((1, 0), (127, 127, 127, 255))
+    im.putpixel((2, 0), (128, 128, 128, 255))
+    assert ink_mask(im).tolist() == [[True, True, False]]
+
+
+@pytest.mark.skipif(
+    not (shutil.which("potrace") and shutil.which("convert")),
+    reason="needs potrace and ImageMagick's convert"
+)
+def test_potrace_svg_matches_convert_to_svg(tmp_path):
+    im = Image.new("RGBA", (300, 80), (255, 255, 255, 255))
+    ImageDraw.Draw(im).text(
+        (5, 5),
+        "Wolf gyp",
+        font=get_font(bench_font, 50),
+        fill=(0, 0, 0, 255)
+    )
+    im.save(str(tmp_path / "line.png"))
+    subprocess.run(
+        ["bash", convert_to_svg, "-c", "#123456", "line.png"],
+        cwd=str(tmp_path),
+        check=True
+    )
+    with open(str(tmp_path / "line.svg")) as f:
+        assert potrace_svg(im, "#123456") == f.read()
@@ -0,0 +1,82 @@
+"""Images drawn and written a strip at a time."""
+import os
+import pytest
+from PIL import Image
+import text_img_creator as tic
+from text_img_creator.img_utils import ImageText
+from text_img_creator.test.benchmarks import (
+    bench_font,
+    no_seperation,
+    rss_growth_kb,
+    tall_font_size,
+    tall_text,
+    wide_font_size,
+    wide_text,
+)
+from text_img_creator.tiled import make_tiled_image
+
+
+@pytest.mark.parametrize("ext", [".png", ".tif"])
+@pytest.mark.parametrize("horizontal", [False, True])
+def test_strips_match_make_lean_image(tmp_path, ext, horizontal):
+    text = [ImageText(t) for t in ["Wolf", "gyp Qqj", "AVATAR To."]]
+    kwargs = dict(
+        font_name=bench_font,
+        font_size=40,
+        horizontal=horizontal,
+        require_even=True,
+        text_seperation=lambda x: x // 4,
+        measure=tic.metrics_measure
+    )
+    ip, = tic.make_lean_image(
+        str(tmp_path / "lean"),
+        text,
+        ext=".png",
+        in_memory=True,
+        **kwargs
+    )
+    make_tiled_image(
+        str(tmp_path / "tiled"),
+        text,
+        ext=ext,
+        strip_height=7,
+        **kwargs
+    )
+    with Image.open(str(tmp_path / ("tiled" + ext))) as tiled:
+        assert tiled.size == ip[tic.img_key].size
+        assert tiled.convert("RGBA").tobytes() == ip[tic.img_key].tobytes()
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/clear_refs"),
+    reason="needs a resettable peak resident set size"
+)
+def test_memory_bounded_by_strips():
+    width, height, _, _ = tic.determine_min_image_size(
+        tall_text(),
+        no_seperation,
+        font_name=bench_font,
+        font_size=tall_font_size,
+        measure=tic.metrics_measure
+    )
+    canvas_kb = width * height * 4 // 1024
+    # The full canvas shows up in the measurement of make_lean_image
+    assert rss_growth_kb("make_lean_image[raster,tall]") > canvas_kb / 2
+    assert rss_growth_kb("make_tiled_image[tall]") < canvas_kb / 4
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/clear_refs"),
+    reason="needs a resettable peak resident set size"
+)
+def test_memory_bounded_by_glyphs():
+    width, height, _, _ = tic.determine_min_image_size(
+        wide_text(),
+        no_seperation,
+        font_name=bench_font,
+        font_size=wide_font_size,
+        measure=tic.metrics_measure
+    )
+    # Rendering the line whole for a strip takes a byte per pixel of it
+    line_kb = width * height // 1024
+    assert rss_growth_kb("make_tiled_image[wide]") < line_kb * 3 / 4
@@ -0,0 +1,410 @@
+"""Render large images in horizontal strips, streaming them to disk.
+
+Only one strip of the canvas is held in memory at a time: the text is
+laid out once, each strip is drawn with the glyphs crossing it and handed
+to a writer encoding it straight into the output file. Writers exist for
+PNG (zlib streamed into IDAT chunks) and uncompressed TIFF.
+"""
+import struct
+import zlib
+from os import environ
+from PIL import Image, ImageDraw
+from text_img_creator import (
+    back_col_key,
+    black_col,
+    default_color_mode,
+    determine_min_image_size,
+    instrument,
+    linear_calibration,
+    metrics_measure,
+    place_lines,
+    white_col,
+)
+from text_img_creator.glyph_atlas import GlyphAtlas
+from text_img_creator.img_utils import ImageProps, png_chunk, png_signature
+
+default_strip_height = 256
+png_color_types = {"L": 0, "RGB": 2, "RGBA": 6}
+png_chunk_size = 1 << 20
+tiff_photometric = {"L": 1, "RGB": 2, "RGBA": 2}
+tiff_short = 3
+tiff_long = 4
+tiff_max_bytes = (1 << 32) - 1
+
+
+class PngStripWriter:
+    """Write a PNG from strips of rows, compressing as they come."""
+
+    def __init__(
+        self,
+        path,
+        width,
+        height,
+        mode=default_color_mode,
+        compress_level=6
+    ):
+        """Open path and write the PNG header."""
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows = 0
+        self._stride = width * len(mode)
+        self._compress = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_bytes = 0
+        self._f = open(path, "wb")
+        self._f.write(png_signature)
+        self._f.write(png_chunk(b"IHDR", struct.pack(
+            ">IIBBBBB",
+            width,
+            height,
+            8,
+            png_color_types[mode],
+            0,
+            0,
+            0
+        )))
+
+    def _add(self, data):
+        """Queue compressed data, writing IDAT chunks of png_chunk_size."""
+        if not data:
+            return
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= png_chunk_size:
+            self._f.write(png_chunk(b"IDAT", b"".join(self._pending)))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def write(self, strip):
+        """Append the rows of PIL image strip."""
+        raw = memoryview(strip.tobytes())
+        stride = self._stride
+        compress = self._compress.compress
+        for i in range(0, len(raw), stride):
+            # Filter type 0 (none) in front of every row
+            self._add(compress(b"\0"))
+            self._add(compress(raw[i:i + stride]))
+        self.rows += strip.height
+
+    def close(self):
+        """Finish compression and write the end of the file."""
+        if self.rows != self.height:
+            self._f.close()
+            raise ValueError(
+                "wrote " + str(self.rows) + " of " + str(self.height) +
+                " rows"
+            )
+        self._pending.append(self._compress.flush())
+        self._f.write(png_chunk(b"IDAT", b"".join(self._pending)))
+        self._f.write(png_chunk(b"IEND", b""))
+        self._f.close()
+
+    def __enter__(self):
+        """Use writer as context manager."""
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        """Close writer, just the file if an error is raised."""
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+
+class TiffStripWriter:
+    """Write an uncompressed TIFF, one TIFF strip per written strip.
+
+    Strips are written as they come and the directory listing them at
+    the end. All strips but the last must have rows_per_strip rows. The
+    file can not exceed 4 GiB (no BigTIFF).
+    """
+
+    def __init__(
+        self,
+        path,
+        width,
+        height,
+        mode=default_color_mode,
+        rows_per_strip=default_strip_height
+    ):
+        """Open path and write the TIFF header."""
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows = 0
+        self.rows_per_strip = rows_per_strip
+        self._offsets = []
+        self._counts = []
+        self._f = open(path, "wb")
+        # Directory offset is filled in by close
+        self._f.write(b"II*\0" + struct.pack("<I", 0))
+
+    def write(self, strip):
+        """Append the rows of PIL image strip."""
+        if self.rows % self.rows_per_strip:
+            raise ValueError("only the last strip may be short")
+        data = strip.tobytes()
+        offset = self._f.tell()
+        if offset + len(data) > tiff_max_bytes:
+            raise ValueError("image too large for TIFF")
+        self._offsets.append(offset)
+        self._counts.append(len(data))
+        self._f.write(data)
+        self.rows += strip.height
+
+    def close(self):
+        """Write the image directory and close the file."""
+        if self.rows != self.height:
+            self._f.close()
+            raise ValueError(
+                "wrote " + str(self.rows) + " of " + str(self.height) +
+                " rows"
+            )
+        samples = len(self.mode)
+        entries = [
+            (256, tiff_long, [self.width]),
+            (257, tiff_long, [self.height]),
+            (258, tiff_short, [8] * samples),
+            (259, tiff_short, [1]),
+            (262, tiff_short, [tiff_photometric[self.mode]]),
+            (273, tiff_long, self._offsets),
+            (277, tiff_short, [samples]),
+            (278, tiff_long, [self.rows_per_strip]),
+            (279, tiff_long, self._counts),
+            (284, tiff_short, [1]),
+        ]
+        if self.mode == "RGBA":
+            # Unassociated alpha
+            entries.append((338, tiff_short, [2]))
+
+        f = self._f
+        if f.tell() % 2:
+            f.write(b"\0")
+        ifd = f.tell()
+        extra = ifd + 2 + 12 * len(entries) + 4
+        directory = [struct.pack("<H", len(entries))]
+        values = []
+        for tag, kind, items in entries:
+            fmt = "<" + ("H" if kind == tiff_short else "I") * len(items)
+            data = struct.pack(fmt, *items)
+            if len(data) <= 4:
+                field = data.ljust(4, b"\0")
+            else:
+                field = struct.pack("<I", extra)
+                values.append(data)
+                extra += len(data)
+            directory.append(
+                struct.pack("<HHI", tag, kind, len(items)) + field
+            )
+        directory.append(struct.pack("<I", 0))
+        f.write(b"".join(directory + values))
+        f.seek(4)
+        f.write(struct.pack("<I", ifd))
+        f.close()
+
+    def __enter__(self):
+        """Use writer as context manager."""
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        """Close writer, just the file if an error is raised."""
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+
+def strip_writer(
+    path,
+    ext,
+    width,
+    height,
+    mode=default_color_mode,
+    strip_height=default_strip_height,
+    compress_level=6
+):
+    """Get writer for ext (.png, .tif or .tiff)."""
+    ext = ext.lower()
+    if ext == ".png":
+        return PngStripWriter(path, width, height, mode, compress_level)
+    if ext in (".tif", ".tiff"):
+        return TiffStripWriter(path, width, height, mode, strip_height)
+    raise ValueError("no strip writer for " + ext)
+
+
+def strip_boxes(height, strip_height):
+    """Yield (top, bottom) of the strips covering height rows."""
+    for top in range(0, height, strip_height):
+        yield top, min(top + strip_height, height)
+
+
+def paint_strip_border(strip, col, first, last):
+    """Paint the part of the image border lying in strip with col."""
+    width, height = strip.size
+    strip.paste(col, (0, 0, 1, height))
+    strip.paste(col, (width - 1, 0, width, height))
+    if first:
+        strip.paste(col, (0, 0, width, 1))
+    if last:
+        strip.paste(col, (0, height - 1, width, height))
+
+
+def create_tiled_image(
+    width,
+    height,
+    col,
+    mode=default_color_mode,
+    fname="tmp",
+    ext=None,
+    strip_height=default_strip_height
+):
+    """Create blank image like create_image, a strip at a time."""
+    if ext is None:
+        ext = environ["default_img_format"]
+    strip = Image.new(mode, (width, min(strip_height, height)), col)
+    writer = strip_writer(fname + ext, ext, width, height, mode, strip_height)
+    with writer:
+        for top, bottom in strip_boxes(height, strip_height):
+            if bottom - top < strip.height:
+                strip = strip.crop((0, 0, width, bottom - top))
+            writer.write(strip)
+    instrument.count_file_size(fname + ext)
+    return ImageProps(fname, ext, width, height)
+
+
+@instrument.timed("make_tiled_image")
+def make_tiled_image(
+    fname,
+    text,
+    background_color=white_col,
+    text_color=black_col,
+    font_name=None,
+    font_size=None,
+    ext=None,
+    require_even=False,
+    start_height=0,
+    start_width=0,
+    text_seperation=lambda x: 0,
+    image_props=None,
+    horizontal=False,
+    add_border=True,
+    calibration=linear_calibration,
+    measure=metrics_measure,
+    measure_index=None,
+    strip_height=default_strip_height,
+    compress_level=6,
+    glyph_atlas=None
+):
+    """Make raster image like make_lean_image, strip by strip.
+
+    Takes the layout arguments of make_lean_image and produces the same
+    pixels for the same measure, but draws strip_height rows at a time and
+    streams them into a PNG or TIFF file. compress_level is the zlib level
+    of PNG output.
+
+    Lines are drawn with glyph_atlas (a GlyphAtlas), by default one
+    keeping up to a byte per strip pixel of glyph masks. Only the glyphs
+    crossing a strip are rendered, one at a time, and only the strip's
+    slice of each line is put together, so memory stays bounded by a few
+    strips plus the masks of a couple of glyphs (a byte per pixel), not by
+    the image or its lines. Glyphs larger than the atlas are rendered again
+    for every strip they cross. Text is measured from font metrics by
+    default, as rendered probes are as large as the lines. Without numpy,
+    and where the atlas falls back to ImageDraw.text (such as fonts using
+    raqm layout), every strip renders the whole mask of each line crossing
+    it instead.
+    """
+    if ext is None:
+        ext = environ["default_img_format"]
+    if image_props is None:
+        width, height, wh, image_font = determine_min_image_size(
+            text,
+            text_seperation,
+            font_name=font_name,
+            font_size=font_size,
+            horizontal=horizontal,
+            calibration=calibration,
+            measure=measure,
+            measure_index=measure_index
+        )
+    else:
+        width, height, wh, image_font = image_props
+    if require_even:
+        width += width % 2
+        height += height % 2
+
+    # Rows each line's ink covers, to only draw lines crossing a strip
+    lines = []
+    placed = place_lines(
+        wh,
+        width,
+        text_seperation,
+        horizontal,
+        require_even,
+        start_width,
+        start_height
+    )
+    for (t, _, _, _, _, col), ((x, y), _) in zip(wh, placed):
+        _, top, _, bottom = image_font.getbbox(t)
+        lines.append((t, x, y, col or text_color, y + top, y + bottom))
+
+    if glyph_atlas is None:
+        try:
+            glyph_atlas = GlyphAtlas(width * min(strip_height, height))
+        except ImportError:
+            pass
+
+    dest = fname + ext
+    writer = strip_writer(
+        dest,
+        ext,
+        width,
+        height,
+        default_color_mode,
+        strip_height,
+        compress_level
+    )
+    strip = Image.new(
+        default_color_mode,
+        (width, min(strip_height, height)),
+        background_color
+    )
+    with writer:
+        for top, bottom in strip_boxes(height, strip_height):
+            if bottom - top < strip.height:
+                strip = strip.crop((0, 0, width, bottom - top))
+            with instrument.stage("draw"):
+                strip.paste(background_color, (0, 0) + strip.size)
+                d = ImageDraw.Draw(strip)
+                for t, x, y, col, ink_top, ink_bottom in lines:
+                    if ink_bottom <= top or ink_top >= bottom:
+                        continue
+                    if glyph_atlas is None:
+                        d.text((x, y - top), t, font=image_font, fill=col)
+                    else:
+                        glyph_atlas.draw(
+                            strip,
+                            (x, y - top),
+                            t,
+                            image_font,
+                            col,
+                            clip=True
+                        )
+                if add_border:
+                    paint_strip_border(
+                        strip,
+                        background_color,
+                        top == 0,
+                        bottom == height
+                    )
+            with instrument.stage("encode"):
+                writer.write(strip)
+    instrument.count_file_size(dest)
+    return [ImageProps(
+        fname,
+        ext,
+        width,
+        height,
+        **{back_col_key: background_color}
+    )]